@@ -0,0 +1,227 @@
+"""
+End-to-end load test for the scaffold app.
+
+Seeds a scratch SQLite database, then drives the real app through its WSGI
+interface at a fixed concurrency and reports latency percentiles and
+throughput per route. SES is replaced by a stub so that /contact never leaves
+the process.
+
+Readers are mostly anonymous, so by default 80% of the requests to routes
+anyone can use (--anonymous) are made without logging in. Those go through
+the page cache and count views, as real traffic does; the rest are made as
+the seeded admin, as are the requests to routes only admins can use.
+
+Usage (from the part_4_blog directory):
+    python -m benchmarks.load_test --posts 1000 --concurrency 8 --output baseline.json
+    python -m benchmarks.load_test --compare baseline.json --tolerance 0.25
+"""
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import seed
+from scaffold.core import views
+
+
+# The app answers some failures with a 200 status: its error page, the email
+# problem page, the failed login page and CKEditor's upload_fail JSON.
+ERROR_MARKERS = (b'likely to be eaten by a grue', b'problem with emailing', b'Incorrect login credentials')
+
+
+class StubSes():
+    """
+    Stand-in for scaffold.utilities.ses.Ses that accepts every message.
+    """
+    email = 'stub@example.com'
+
+    def send_email(self, subject, body, body_html, client_address) -> bool:
+        return True
+
+
+def scenarios(published, files):
+    """
+    Each scenario is a pair: a function that takes a test client and a Random
+    and makes one request, returning the response, and whether only admins
+    can make it.
+    """
+    return {
+        'blog': (lambda client, rng: client.get('/blog'), False),
+        'read_post': (lambda client, rng: client.get(f'/{rng.choice(published)}'), False),
+        'login': (lambda client, rng: client.post('/login', data={'email': seed.ADMIN_EMAIL,
+                                                                  'password': seed.ADMIN_PASSWORD,
+                                                                  'g-recaptcha-response': 'load-test'}), True),
+        'contact': (lambda client, rng: client.post('/contact', data={'email': 'reader@example.com',
+                                                                      'name': 'Reader',
+                                                                      'message': 'Hello there.',
+                                                                      'g-recaptcha-response': 'load-test'}), False),
+        'upload': (lambda client, rng: client.post('/upload', data={'upload': (io.BytesIO(seed.PNG_BYTES),
+                                                                               f'load_{rng.randrange(1000)}.png')}),
+                   True),
+        'files': (lambda client, rng: client.get(f'/files/{rng.choice(files)}'), False),
+    }
+
+
+def failed(response, body):
+    """
+    Whether a response is an error, judged by its body as well as its status.
+    """
+    if response.status_code >= 400:
+        return True
+
+    if response.is_json:
+        return 'error' in (response.get_json(silent=True) or {})
+
+    return any(marker in body for marker in ERROR_MARKERS)
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def run(scenario, requests, concurrency, anonymous):
+    """
+    Make `requests` calls to one scenario spread over `concurrency` threads,
+    a share `anonymous` of them without logging in unless the scenario is
+    for admins only.
+    """
+    scenario, admin_only = scenario
+    app = seed.app
+    local = threading.local()
+    latencies = []
+    timings = {}
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        if not hasattr(local, 'admin'):
+            local.admin = app.test_client()
+            local.anonymous = app.test_client()
+            local.rng = random.Random(i)
+            seed.login(local.admin)
+
+        client = local.admin if admin_only or local.rng.random() >= anonymous else local.anonymous
+
+        start = time.perf_counter()
+        response = scenario(client, local.rng)
+        body = response.get_data()  # Streamed pages only render as the body is read.
+        elapsed = (time.perf_counter() - start) * 1000
+
+        with lock:
+            latencies.append(elapsed)
+            for name, duration in server_timing(response):
+                timings.setdefault(name, []).append(duration)
+            if failed(response, body):
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    result = {
+        'requests': requests,
+        'errors': errors,
+        'rps': round(requests / wall, 2),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+    }
+
+    # Time the app reports spending on individual steps, e.g. ReCaptcha.
+    for name, durations in timings.items():
+        durations.sort()
+        result[f'{name}_p50_ms'] = round(percentile(durations, 50), 3)
+        result[f'{name}_p95_ms'] = round(percentile(durations, 95), 3)
+
+    return result
+
+
+def server_timing(response):
+    """
+    Yield (name, milliseconds) pairs from a response's Server-Timing headers.
+    """
+    for header in response.headers.getlist('Server-Timing'):
+        for metric in header.split(','):
+            name, _, duration = metric.strip().partition(';dur=')
+            if duration:
+                yield name, float(duration)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return a list of human readable regressions: any route whose p95 grew, or
+    whose throughput shrank, by more than `tolerance` (a fraction).
+    """
+    regressions = []
+
+    for name, old in baseline['routes'].items():
+        new = results['routes'].get(name)
+        if new is None:
+            continue
+        if new['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {old['p95_ms']} ms -> {new['p95_ms']} ms")
+        if new['rps'] < old['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: rps {old['rps']} -> {new['rps']}")
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=500, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--anonymous', type=float, default=0.8,
+                        help='share of requests made without logging in, on routes anyone can use')
+    parser.add_argument('--routes', nargs='*', help='only run these routes')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    views.Ses = StubSes
+    published, files = seed.seed(users=args.users, posts=args.posts, files=args.files)
+
+    results = {
+        'python': platform.python_version(),
+        'params': {key: getattr(args, key) for key in ('users', 'posts', 'files', 'requests', 'concurrency',
+                                                                     'anonymous')},
+        'routes': {},
+    }
+
+    for name, scenario in scenarios(published, files).items():
+        if args.routes and name not in args.routes:
+            continue
+        results['routes'][name] = run(scenario, args.requests, args.concurrency, args.anonymous)
+        print(name, json.dumps(results['routes'][name]))
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            regressions = compare(results, json.load(infile), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Memory used per worker by a pre-forking server, with and without preload().
+
+Each mode runs in its own process acting as a master that forks --workers
+children. In 'baseline' mode each child imports the app itself, as workers do
+without --preload; in 'preload' mode the master imports the app and calls
+preload() before forking. Every child then serves the same mix of requests,
+and once all are warm the master reads their PSS (proportional set size:
+private memory plus an even share of the pages still shared with the master
+and siblings) and USS (private memory only) from /proc, so this only runs on
+Linux.
+
+Usage (from the part_4_blog directory):
+    python -m benchmarks.memory --workers 4
+"""
+import os
+import sys
+import json
+import signal
+import argparse
+import tempfile
+import subprocess
+
+
+PATHS = ['/', '/blog', '/login', '/contact', '/{post_id}', '/files/{filename}']
+
+
+def memory(pid):
+    """
+    PSS and USS of a process in KB.
+    """
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as infile:
+        for line in infile:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+
+    return {'pss_kb': fields['Pss'], 'uss_kb': fields['Private_Clean'] + fields['Private_Dirty']}
+
+
+def worker(requests, ready):
+    from benchmarks import seed
+    from scaffold import db
+    from scaffold.models import BlogPost
+
+    app = seed.configure()
+    with app.app_context():
+        post_ids = db.session.execute(db.select(BlogPost.id).filter_by(published=True)).scalars().all()
+    names = sorted(os.listdir(app.config['UPLOADED_PATH']))
+    client = app.test_client()
+
+    for i in range(requests):
+        path = PATHS[i % len(PATHS)].format(post_id=post_ids[i % len(post_ids)], filename=names[i % len(names)])
+        client.get(path).get_data()
+
+    os.write(ready, b'.')
+    signal.pause()
+
+
+def master(mode, workers, requests):
+    if mode == 'preload':
+        from benchmarks import seed
+        from scaffold.utilities.preload import preload
+        preload(seed.configure())
+
+    ready_read, ready_write = os.pipe()
+    pids = []
+
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            worker(requests, ready_write)
+            os._exit(0)
+        pids.append(pid)
+
+    for _ in pids:
+        os.read(ready_read, 1)
+
+    results = [memory(pid) for pid in pids]
+
+    for pid in pids:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+
+    print(json.dumps({'mode': mode, 'master': memory(os.getpid()), 'workers': results}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200, help='requests each worker serves before measuring')
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--mode', choices=['seed', 'baseline', 'preload'], help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.mode == 'seed':
+        from benchmarks import seed
+        seed.seed(posts=args.posts)
+        return 0
+
+    if args.mode:
+        master(args.mode, args.workers, args.requests)
+        return 0
+
+    # Seed once, into a scratch directory every mode's processes share.
+    env = dict(os.environ, BENCHMARK_WORKDIR=tempfile.mkdtemp(prefix='scaffold-bench-'))
+    subprocess.run([sys.executable, '-m', 'benchmarks.memory', '--mode', 'seed', '--posts', str(args.posts)],
+                   env=env, capture_output=True, check=True)
+
+    print(f'{"mode":>10} {"avg PSS":>12} {"avg USS":>12} {"total PSS":>12}')
+    for mode in ('baseline', 'preload'):
+        # A fresh interpreter per mode, so neither inherits the other's imports.
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.memory', '--mode', mode,
+                                 '--workers', str(args.workers), '--requests', str(args.requests)],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+
+        workers = result['workers']
+        pss = sum(w['pss_kb'] for w in workers) / len(workers)
+        uss = sum(w['uss_kb'] for w in workers) / len(workers)
+        total = sum(w['pss_kb'] for w in workers) + result['master']['pss_kb']
+        print(f'{mode:>10} {pss / 1024:>9.1f} MB {uss / 1024:>9.1f} MB {total / 1024:>9.1f} MB')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Micro-benchmarks for the per-request hot spots, each measured in isolation:
+    - nh3.clean on CKEditor-style payloads from 1 KB to 1 MB
+    - User.check_password for each supported hash method
+    - render_template for blog/blog.html and blog/read_post.html
+    - Ses.send_email against a botocore Stubber (no network)
+    - ContactFilter.check accepting and rejecting a submission
+
+Usage (from the part_4_blog directory):
+    python -m benchmarks.micro
+    python -m benchmarks.micro --only nh3 render --output micro.json
+"""
+import sys
+import json
+import logging
+import random
+import timeit
+import argparse
+import datetime
+
+import nh3
+import boto3
+from botocore.stub import Stubber
+from flask import render_template
+from werkzeug.security import generate_password_hash
+
+from benchmarks import seed
+from scaffold.models import User, BlogPost
+from scaffold.utilities.ses import Ses
+
+
+def measure(func, repeat=5):
+    """
+    Best-of-`repeat` seconds per call, letting timeit pick the loop count.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def ckeditor_payload(size, rng):
+    """
+    HTML shaped like CKEditor output, including markup nh3 has to strip.
+    """
+    chunks = []
+    while sum(len(chunk) for chunk in chunks) < size:
+        chunks.append(seed.paragraph(rng, words=40))
+        chunks.append('<h2 style="color:red">Heading</h2><img src="/files/a.png" onerror="alert(1)">')
+        chunks.append('<pre><code class="language-python">print("hi")</code></pre><script>alert(1)</script>')
+
+    return ''.join(chunks)[:size]
+
+
+def bench_nh3(rng):
+    for size in (1_000, 10_000, 100_000, 1_000_000):
+        payload = ckeditor_payload(size, rng)
+        yield f'nh3.clean {size // 1000} KB', measure(lambda: nh3.clean(payload))
+
+
+def bench_passwords(rng):
+    user = User(username='bench', email='bench@example.com', password='x', admin=False)
+
+    for method in ('scrypt', 'pbkdf2:sha256', 'pbkdf2:sha256:100000'):
+        user.password_hash = generate_password_hash('benchmark-password', method=method)
+        yield f'check_password {method}', measure(lambda: user.check_password('benchmark-password'), repeat=3)
+
+
+def fake_posts(count, rng, paragraphs=3):
+    author = User(username='bench', email='bench@example.com', password='x', admin=False)
+    posts = []
+
+    for i in range(count):
+        post = BlogPost(author_id=None,
+                        date=datetime.datetime(2024, 1, 1) + datetime.timedelta(hours=i),
+                        title=f'Post {i}',
+                        content=''.join(seed.paragraph(rng) for _ in range(paragraphs)),
+                        published=True)
+        post.id = i + 1
+        post.author = author
+        posts.append(post)
+
+    return posts
+
+
+def bench_render(rng):
+    app = seed.configure()
+
+    with app.test_request_context():
+        for count in (10, 100, 1_000, 10_000):
+            posts = fake_posts(count, rng)
+            yield f'render blog.html {count} posts', measure(lambda: render_template('blog/blog.html', posts=posts), repeat=3)
+
+        for size in (10_000, 100_000, 1_000_000):
+            post = fake_posts(1, rng)[0]
+            post.content = ckeditor_payload(size, rng)
+            yield f'render read_post.html {size // 1000} KB', measure(lambda: render_template('blog/read_post.html', post=post))
+
+
+def bench_ses(rng):
+    ses = Ses.__new__(Ses)
+    ses.email = 'sender@example.com'
+    ses.charset = 'UTF-8'
+    ses.client = boto3.client('ses', region_name='us-east-1',
+                              aws_access_key_id='benchmark', aws_secret_access_key='benchmark')
+
+    # send_email logs every message; keep the terminal readable while timing.
+    logging.getLogger('scaffold').disabled = True
+
+    with Stubber(ses.client) as stubber:
+        def send():
+            stubber.add_response('send_email', {'MessageId': 'benchmark'})
+            ses.send_email(subject='hello', body='Hello!', body_html='<p>Hello!</p>',
+                           client_address='reader@example.com')
+
+        yield 'Ses.send_email (stubbed)', measure(send)
+
+    logging.getLogger('scaffold').disabled = False
+
+
+def bench_contact_filter(rng):
+    from scaffold import contact_filter
+
+    seed.app.config['CONTACT_FILTER_ENABLED'] = True
+    counter = iter(range(10 ** 9))
+    message = seed.paragraph(rng)
+
+    # A new address and email every time, so every check gets as far as the
+    # duplicate lookup and passes.
+    def accepted():
+        i = next(counter)
+        contact_filter.check(f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}', f'reader{i}@example.com', message, None)
+
+    yield 'ContactFilter.check accepted', measure(accepted)
+    yield 'ContactFilter.check honeypot', measure(lambda: contact_filter.check('10.1.0.1', 'bot@example.com',
+                                                                               message, 'http://spam'))
+    yield 'ContactFilter.check ip_rate', measure(lambda: contact_filter.check('10.0.0.0', 'bot@example.com',
+                                                                              message, None))
+
+
+BENCHMARKS = {
+    'nh3': bench_nh3,
+    'passwords': bench_passwords,
+    'render': bench_render,
+    'ses': bench_ses,
+    'contact_filter': bench_contact_filter,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='*', choices=BENCHMARKS, help='only run these groups')
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    results = {}
+
+    for group, bench in BENCHMARKS.items():
+        if args.only and group not in args.only:
+            continue
+        for name, seconds in bench(rng):
+            results[name] = seconds * 1000
+            print(f'{name:<40} {seconds * 1000:>12.4f} ms')
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
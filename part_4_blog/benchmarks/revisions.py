@@ -0,0 +1,101 @@
+"""
+Storage size and reconstruction time of BlogPost revision history.
+
+Makes hundreds of small edits to one large post for several snapshot
+intervals, then reports the bytes stored against keeping a full copy of every
+revision, and how long reconstruct() takes for the slowest and average
+revision.
+
+Usage (from the part_4_blog directory):
+    python -m benchmarks.revisions --edits 300 --paragraphs 200
+"""
+import sys
+import time
+import random
+import argparse
+import datetime
+
+from benchmarks import seed
+from scaffold import app, db
+from scaffold.models import BlogPost, BlogPostRevision
+from scaffold.utilities.revisions import record_revision, reconstruct
+
+
+def edit(content, rng):
+    """
+    Change, add or remove one paragraph, the way a typical save would.
+    """
+    lines = content.split('\n\n')
+    index = rng.randrange(len(lines))
+    action = rng.random()
+
+    if action < 0.7:
+        lines[index] = seed.paragraph(rng)
+    elif action < 0.85:
+        lines.insert(index, seed.paragraph(rng))
+    elif len(lines) > 1:
+        del lines[index]
+
+    return '\n\n'.join(lines)
+
+
+def run(interval, edits, paragraphs, rng):
+    app.config['REVISION_SNAPSHOT_EVERY'] = interval
+
+    with app.app_context():
+        blog_post = BlogPost(author_id=None, date=datetime.datetime.now(), title='Benchmark',
+                             content='\n\n'.join(seed.paragraph(rng) for _ in range(paragraphs)),
+                             published=False)
+        db.session.add(blog_post)
+        record_revision(blog_post)
+        db.session.commit()
+
+        full_bytes = len(blog_post.content.encode('utf-8'))
+        for _ in range(edits):
+            previous_title, previous_content = blog_post.title, blog_post.content
+            blog_post.content = edit(blog_post.content, rng)
+            record_revision(blog_post, previous_title, previous_content)
+            db.session.commit()
+            full_bytes += len(blog_post.content.encode('utf-8'))
+
+        stored_bytes = db.session.execute(db.select(db.func.sum(db.func.length(BlogPostRevision.data)))
+                                          .filter_by(post_id=blog_post.id)).scalar()
+
+        timings = []
+        for number in range(edits + 1):
+            start = time.perf_counter()
+            reconstruct(blog_post.id, number)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        assert reconstruct(blog_post.id, edits) == blog_post.content
+
+    return {
+        'interval': interval,
+        'full_kb': full_bytes / 1024,
+        'stored_kb': stored_bytes / 1024,
+        'avg_ms': sum(timings) / len(timings),
+        'max_ms': max(timings),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--edits', type=int, default=300)
+    parser.add_argument('--paragraphs', type=int, default=100)
+    parser.add_argument('--intervals', type=int, nargs='*', default=[1, 5, 10, 25, 50])
+    args = parser.parse_args(argv)
+
+    seed.seed(users=1, posts=0, files=0)
+    rng = random.Random(0)
+
+    print(f'{"snapshot every":>14} {"full copies":>14} {"stored":>12} {"ratio":>7} {"avg rebuild":>12} {"max rebuild":>12}')
+    for interval in args.intervals:
+        result = run(interval, args.edits, args.paragraphs, rng)
+        print(f'{result["interval"]:>14} {result["full_kb"]:>11.1f} KB {result["stored_kb"]:>9.1f} KB '
+              f'{result["full_kb"] / result["stored_kb"]:>6.1f}x {result["avg_ms"]:>9.2f} ms {result["max_ms"]:>9.2f} ms')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
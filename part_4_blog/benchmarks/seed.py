@@ -0,0 +1,104 @@
+import os
+import random
+import datetime
+import tempfile
+
+
+# The app reads these at import time, so they must be set before `scaffold` is
+# imported anywhere in the benchmarks. BENCHMARK_WORKDIR lets several processes
+# share one scratch directory. seed() drops every table, so the database is
+# always the scratch one, with no replicas, whatever the shell has set.
+WORKDIR = os.getenv('BENCHMARK_WORKDIR') or tempfile.mkdtemp(prefix='scaffold-bench-')
+os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'bench.sqlite')
+os.environ['DATABASE_REPLICA_URLS'] = ''
+os.environ.setdefault('SCHEDULER_ENABLED', '0')
+
+from scaffold import app, db
+from scaffold.models import User, BlogPost
+
+
+ADMIN_EMAIL = 'admin@example.com'
+ADMIN_PASSWORD = 'benchmark-password'
+
+# A 1x1 transparent PNG, enough to pass the upload view's checks.
+PNG_BYTES = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+         'tempor incididunt ut labore et dolore magna aliqua').split()
+
+
+def configure():
+    """
+    Point the app at the scratch directory, switch off CSRF tokens and answer
+    ReCaptcha locally, since a load generator can't satisfy either. The
+    contact form filters are off too, as every load test submission comes
+    from the same address with the same message.
+    """
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['RECAPTCHA_STUB'] = 'pass'
+    app.config['CONTACT_FILTER_ENABLED'] = False
+    app.config['UPLOADED_PATH'] = os.path.join(WORKDIR, 'uploads')
+    os.makedirs(app.config['UPLOADED_PATH'], exist_ok=True)
+
+    return app
+
+
+def paragraph(rng, words=80):
+    return '<p>' + ' '.join(rng.choice(WORDS) for _ in range(words)) + '</p>'
+
+
+def seed(users=10, posts=100, files=10, paragraphs=5, seed=0):
+    """
+    Create a fresh schema and fill it with users, posts and upload files.
+    The first user is always an admin with ADMIN_EMAIL / ADMIN_PASSWORD.
+    Returns the ids of the published posts and the names of the files.
+    """
+    rng = random.Random(seed)
+    configure()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        authors = [User(username='admin', email=ADMIN_EMAIL, password=ADMIN_PASSWORD, admin=True)]
+        authors += [User(username=f'user{i}', email=f'user{i}@example.com', password=ADMIN_PASSWORD, admin=False)
+                    for i in range(1, users)]
+        db.session.add_all(authors)
+        db.session.flush()
+
+        start = datetime.datetime(2024, 1, 1)
+        db.session.add_all(
+            BlogPost(author_id=rng.choice(authors).id,
+                     date=start + datetime.timedelta(hours=i),
+                     title=f'Post {i}',
+                     content=''.join(paragraph(rng) for _ in range(paragraphs)),
+                     published=rng.random() < 0.9)
+            for i in range(posts))
+        db.session.commit()
+
+        published = db.session.execute(db.select(BlogPost.id).filter_by(published=True)).scalars().all()
+
+    names = []
+    for i in range(files):
+        name = f'seed_{i}.png'
+        with open(os.path.join(app.config['UPLOADED_PATH'], name), 'wb') as outfile:
+            outfile.write(PNG_BYTES)
+        names.append(name)
+
+    return published, names
+
+
+def login(client):
+    """
+    Log a test client in as the seeded admin.
+    """
+    with app.app_context():
+        admin = db.session.execute(db.select(User).filter_by(email=ADMIN_EMAIL)).scalar()
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
@@ -0,0 +1,25 @@
+import os
+import multiprocessing
+
+
+# Production settings for gunicorn, which reads this file from the directory it
+# is started in:
+#     gunicorn app:app
+#
+# login and contact spend most of their time waiting on ReCaptcha and SES. With
+# the default threaded (gthread) workers each waiting request holds a thread,
+# so a worker serves GUNICORN_THREADS requests at once. With
+# GUNICORN_WORKER_CLASS=gevent it holds a greenlet instead, a few KB rather
+# than a thread's stack, and one worker serves up to
+# GUNICORN_WORKER_CONNECTIONS requests at once for about the same memory.
+# gevent needs `gevent` installed, and can't be combined with preload.py, as
+# it must patch the standard library before the app is imported.
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# gthread only.
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# gevent only.
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
@@ -0,0 +1,10 @@
+from scaffold import app
+from scaffold.utilities.preload import preload
+
+
+# Entry point for a pre-forking server that imports the app once in its master
+# process and forks the workers from it, for example:
+#     gunicorn preload:application --preload --workers 4
+preload(app)
+
+application = app
@@ -1,38 +1,191 @@
 import os
 
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import MetaData
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_wtf import CSRFProtect
 from flask_ckeditor import CKEditor
 
+from scaffold.utilities.log_pipeline import LogPipeline
+from scaffold.utilities.query_monitor import QueryMonitor
+from scaffold.utilities.recaptcha import RecaptchaVerifier
+from scaffold.utilities.single_flight import PageCache
+from scaffold.utilities.storage import create_storage
+from scaffold.utilities.db_routing import RoutingSession, ReplicaRouter
+from scaffold.utilities.assets import Assets
+from scaffold.utilities.contact_filter import ContactFilter
+from scaffold.utilities.runtime_stats import RuntimeStats
+
 
 # Initialize app ---------------------------------------------------------------
 app = Flask(__name__)
-app.logger.warning(f"How to use the logger:\nlogger = logging.getLogger('scaffold')")
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY')
 
+# Proxies ----------------------------------------------------------------------
+# Behind a load balancer every request comes from the balancer's address. Set
+# this to the number of proxies in front of the app to trust the
+# X-Forwarded-For and X-Forwarded-Proto headers they set, so that
+# request.remote_addr is the visitor's. Left at 0 when clients connect
+# directly, as they could otherwise claim any address.
+proxy_count = int(os.getenv('PROXY_FIX_X_FOR', 0))
+if proxy_count:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_count, x_proto=proxy_count)
+
+# Logging ----------------------------------------------------------------------
+# Log records are queued and written out by a background thread, so a slow log
+# sink never holds up a request.
+app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'WARNING')
+app.config['LOG_FORMAT'] = os.getenv('LOG_FORMAT', 'text')
+app.config['LOG_FILE'] = os.getenv('LOG_FILE')
+app.config['LOG_QUEUE_SIZE'] = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+app.config['LOG_SAMPLE_RATE'] = float(os.getenv('LOG_SAMPLE_RATE', 0.1))
+log_pipeline = LogPipeline(app)
+app.logger.warning(f"How to use the logger:\nlogger = logging.getLogger('scaffold')")
+
+
 # Google ReCaptcha -------------------------------------------------------------
 app.config['RECAPTCHA_PUBLIC_KEY'] = os.getenv('RECAP_PUBLIC_KEY')
 app.config['RECAPTCHA_PRIVATE_KEY'] = os.getenv('RECAP_PRIVATE_KEY')
 app.config['RECAPTCHA_DATA_ATTRS'] = {'size': 'compact'}
+app.config['RECAPTCHA_CONNECT_TIMEOUT'] = float(os.getenv('RECAP_CONNECT_TIMEOUT', 2))
+app.config['RECAPTCHA_READ_TIMEOUT'] = float(os.getenv('RECAP_READ_TIMEOUT', 3))
+app.config['RECAPTCHA_CACHE_SECONDS'] = int(os.getenv('RECAP_CACHE_SECONDS', 120))
+app.config['RECAPTCHA_STUB'] = os.getenv('RECAP_STUB')  # 'pass' or 'fail' for tests and load runs
+recaptcha_verifier = RecaptchaVerifier(app)
 
-# Database Setup ---------------------------------------------------------------
+# Templates --------------------------------------------------------------------
+# Compiled templates are cached on disk so every worker can share them; run
+# `flask compile-templates` at deploy time to fill the cache ahead of traffic.
+# This must be configured before anything touches app.jinja_env.
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'data.sqlite')
+app.config['TEMPLATE_CACHE_DIR'] = os.getenv('TEMPLATE_CACHE_DIR', os.path.join(basedir, 'template_cache'))
+os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+app.jinja_options = {**app.jinja_options,
+                     'bytecode_cache': FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])}
+
+# Only check templates for changes when asked to, or when running in debug.
+if os.getenv('TEMPLATES_AUTO_RELOAD') is not None:
+    app.config['TEMPLATES_AUTO_RELOAD'] = os.getenv('TEMPLATES_AUTO_RELOAD') == '1'
+
+# Front-end Assets -------------------------------------------------------------
+# Everything is served from our own static folder. Above-the-fold styles are
+# inlined into each page and the rest is preloaded without blocking rendering.
+# Our own styles are inlined after Bootstrap, so that they override it.
+app.config['ASSETS_INLINE_CSS'] = ['styles/critical.css']
+app.config['ASSETS_SITE_CSS'] = ['styles/base.css']
+app.config['ASSETS_PRELOAD'] = [('vendor/bootstrap/bootstrap.min.css', 'style'),
+                                ('vendor/bootstrap/bootstrap.min.js', 'script')]
+assets = Assets(app)
+
+# Database Setup ---------------------------------------------------------------
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'data.sqlite'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
-Migrate(app, db)
+# Optional read replicas, as a comma separated list of database URLs. Views
+# marked @read_only read from them; everything else uses the primary above.
+replica_urls = [url for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url]
+app.config['SQLALCHEMY_BINDS'] = {f'replica_{i}': url for i, url in enumerate(replica_urls)}
+app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv('REPLICA_STICKY_SECONDS', 30))
+
+# SQLite can't alter a table in place, so migrations recreate it ("batch"
+# mode), which needs every constraint to have a name.
+metadata = MetaData(naming_convention={
+    'ix': 'ix_%(column_0_label)s',
+    'uq': 'uq_%(table_name)s_%(column_0_name)s',
+    'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s',
+    'pk': 'pk_%(table_name)s',
+})
+db = SQLAlchemy(app, metadata=metadata, session_options={'class_': RoutingSession})
+Migrate(app, db, render_as_batch=True)
+replica_router = ReplicaRouter(app)
+
+# Runtime Stats ----------------------------------------------------------------
+# Connection pool counters for the admin stats endpoint at /admin/stats.
+runtime_stats = RuntimeStats(app, db)
+
+# Query Monitor (development and tests only) -----------------------------------
+app.config['QUERY_MONITOR'] = os.getenv('QUERY_MONITOR') == '1'
+app.config['QUERY_MONITOR_SLOW_MS'] = float(os.getenv('QUERY_MONITOR_SLOW_MS', 100))
+app.config['QUERY_MONITOR_REPEAT_THRESHOLD'] = int(os.getenv('QUERY_MONITOR_REPEAT_THRESHOLD', 3))
+app.config['QUERY_MONITOR_ENFORCE_BUDGETS'] = os.getenv('QUERY_MONITOR_ENFORCE_BUDGETS') == '1'
+query_monitor = QueryMonitor(app)
 
 # CKEditor ---------------------------------------------------------------------
 app.config['CKEDITOR_FILE_UPLOADER'] = 'core.upload'
 app.config['UPLOADED_PATH'] = os.path.join(basedir, 'uploads')
+# Whole request bodies over MAX_CONTENT_LENGTH are refused before being read.
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+app.config['UPLOAD_MAX_FILE_SIZE'] = int(os.getenv('UPLOAD_MAX_FILE_SIZE', 8 * 1024 * 1024))
 app.config['CKEDITOR_ENABLE_CSRF'] = True
 app.config['CKEDITOR_ENABLE_CODESNIPPET'] = True
+# Use the copy of CKEditor bundled with Flask-CKEditor rather than its CDN.
+app.config['CKEDITOR_SERVE_LOCAL'] = True
 ckeditor = CKEditor(app)
 
+# Upload Storage ---------------------------------------------------------------
+# 'local' keeps uploads in UPLOADED_PATH; 's3' puts them in an S3-compatible
+# bucket so workers on any host can serve them.
+app.config['STORAGE_BACKEND'] = os.getenv('STORAGE_BACKEND', 'local')
+app.config['S3_BUCKET'] = os.getenv('S3_BUCKET')
+app.config['S3_PREFIX'] = os.getenv('S3_PREFIX', 'uploads/')
+app.config['S3_REGION'] = os.getenv('S3_REGION')
+app.config['S3_ENDPOINT_URL'] = os.getenv('S3_ENDPOINT_URL')
+app.config['S3_PART_SIZE'] = int(os.getenv('S3_PART_SIZE', 8 * 1024 * 1024))
+app.config['S3_URL_EXPIRES'] = int(os.getenv('S3_URL_EXPIRES', 3600))
+storage = create_storage(app.config)
+
+# View Counters ----------------------------------------------------------------
+app.config['VIEW_COUNTER_FLUSH_SECONDS'] = float(os.getenv('VIEW_COUNTER_FLUSH_SECONDS', 10))
+app.config['VIEW_COUNTER_FLUSH_EVERY'] = int(os.getenv('VIEW_COUNTER_FLUSH_EVERY', 500))
+app.config['POPULAR_POSTS_REFRESH_SECONDS'] = float(os.getenv('POPULAR_POSTS_REFRESH_SECONDS', 300))
+app.config['POPULAR_POSTS_COUNT'] = int(os.getenv('POPULAR_POSTS_COUNT', 5))
+
+# Revision History -------------------------------------------------------------
+# Every Nth revision of a post is stored in full; the rest are deltas.
+app.config['REVISION_SNAPSHOT_EVERY'] = int(os.getenv('REVISION_SNAPSHOT_EVERY', 10))
+
+# Draft Autosave ---------------------------------------------------------------
+# Autosaved drafts are kept in memory and written at most this often.
+app.config['DRAFT_FLUSH_SECONDS'] = float(os.getenv('DRAFT_FLUSH_SECONDS', 10))
+app.config['DRAFT_IDLE_SECONDS'] = float(os.getenv('DRAFT_IDLE_SECONDS', 3600))
+
+# Tags and Archives ------------------------------------------------------------
+# Posts per page of /blog/tag/<slug> and /blog/<year>/<month>.
+app.config['ARCHIVE_PAGE_SIZE'] = int(os.getenv('ARCHIVE_PAGE_SIZE', 20))
+
+# Related Posts ----------------------------------------------------------------
+# Lists are kept up to date as posts are edited; `flask related-posts` rebuilds
+# them all.
+app.config['RELATED_POSTS_COUNT'] = int(os.getenv('RELATED_POSTS_COUNT', 5))
+app.config['RELATED_POSTS_BATCH_SIZE'] = int(os.getenv('RELATED_POSTS_BATCH_SIZE', 256))
+
+# Page Cache -------------------------------------------------------------------
+# Pages anonymous readers see are cached per process and regenerated by a single
+# request at a time; stale pages are served while they are being regenerated.
+app.config['PAGE_CACHE_SECONDS'] = float(os.getenv('PAGE_CACHE_SECONDS', 30))
+app.config['PAGE_CACHE_STALE_SECONDS'] = float(os.getenv('PAGE_CACHE_STALE_SECONDS', 300))
+app.config['PAGE_CACHE_SIZE'] = int(os.getenv('PAGE_CACHE_SIZE', 1000))
+# Bigger pages (in characters) are streamed rather than held in the cache.
+app.config['PAGE_CACHE_MAX_PAGE_SIZE'] = int(os.getenv('PAGE_CACHE_MAX_PAGE_SIZE', 256 * 1024))
+# A request waiting on another's render of the same page gives up and renders
+# it itself after this many seconds.
+app.config['PAGE_CACHE_WAIT_SECONDS'] = float(os.getenv('PAGE_CACHE_WAIT_SECONDS', 10))
+page_cache = PageCache(app)
+
+# Contact Form Filters ---------------------------------------------------------
+# Submissions are rate limited and de-duplicated in memory before ReCaptcha or
+# SES are called.
+app.config['CONTACT_IP_LIMIT'] = int(os.getenv('CONTACT_IP_LIMIT', 5))
+app.config['CONTACT_IP_SECONDS'] = float(os.getenv('CONTACT_IP_SECONDS', 600))
+app.config['CONTACT_EMAIL_LIMIT'] = int(os.getenv('CONTACT_EMAIL_LIMIT', 3))
+app.config['CONTACT_EMAIL_SECONDS'] = float(os.getenv('CONTACT_EMAIL_SECONDS', 3600))
+app.config['CONTACT_DUPLICATE_SECONDS'] = float(os.getenv('CONTACT_DUPLICATE_SECONDS', 86400))
+contact_filter = ContactFilter(app)
+
 # CSRF -------------------------------------------------------------------------
 csrf = CSRFProtect(app)
 
@@ -41,7 +194,17 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'core.login'
 
+# Scheduled Publishing ---------------------------------------------------------
+from scaffold.utilities.scheduler import PublishScheduler
+
+app.config['SCHEDULER_ENABLED'] = os.getenv('SCHEDULER_ENABLED', '1') == '1'
+app.config['SCHEDULER_MAX_SLEEP'] = float(os.getenv('SCHEDULER_MAX_SLEEP', 300))
+publish_scheduler = PublishScheduler(app)
+
 # Blueprint Registrations ------------------------------------------------------
 from scaffold.core.views import core
 
 app.register_blueprint(core)
+
+# CLI Commands -----------------------------------------------------------------
+import scaffold.commands
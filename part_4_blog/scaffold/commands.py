@@ -0,0 +1,64 @@
+import os
+
+import click
+
+from scaffold import app, db
+from scaffold.models import User, BlogPost
+from scaffold.utilities.related_posts import RelatedPosts
+from scaffold.utilities.assets import critical_css
+
+
+@app.cli.command('backfill-authors')
+def backfill_authors():
+    """
+    Point existing blog posts at their author's User row, matching on the
+    legacy username column. Run once after `flask db upgrade`.
+    """
+    author_id = db.select(User.id).where(User.username == BlogPost.user).scalar_subquery()
+    result = db.session.execute(db.update(BlogPost)
+                                .where(BlogPost.author_id.is_(None))
+                                .values(author_id=author_id))
+    db.session.commit()
+
+    click.echo(f'Backfilled {result.rowcount} posts.')
+
+
+@app.cli.command('compile-templates')
+def compile_templates():
+    """
+    Compile every template into the bytecode cache, so that the first request
+    to each worker doesn't pay for parsing and compiling.
+    """
+    names = app.jinja_env.list_templates()
+
+    for name in names:
+        app.jinja_env.get_template(name)
+
+    click.echo(f'Compiled {len(names)} templates into {app.config["TEMPLATE_CACHE_DIR"]}.')
+
+
+@app.cli.command('related-posts')
+def related_posts():
+    """
+    Recompute the related posts of every published post. Edits keep the lists
+    current on their own; run this after importing posts, or from cron to
+    catch the few lists an edit elsewhere should have changed.
+    """
+    post_ids = RelatedPosts().rebuild()
+
+    click.echo(f'Rebuilt related posts for {len(post_ids)} posts.')
+
+
+@app.cli.command('critical-css')
+def extract_critical_css():
+    """
+    Regenerate styles/critical.css, the part of the vendored Bootstrap that
+    base.html inlines, from the rules for its above-the-fold markup.
+    """
+    with open(os.path.join(app.static_folder, 'vendor', 'bootstrap', 'bootstrap.min.css'), encoding='utf-8') as infile:
+        css = critical_css(infile.read())
+
+    with open(os.path.join(app.static_folder, 'styles', 'critical.css'), 'w', encoding='utf-8') as outfile:
+        outfile.write(css)
+
+    click.echo(f'Wrote {len(css)} bytes of critical CSS.')
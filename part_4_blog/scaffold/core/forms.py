@@ -1,25 +1,39 @@
 from flask_wtf import FlaskForm, RecaptchaField
-from wtforms import StringField, PasswordField, SubmitField, TextAreaField
-from wtforms.validators import DataRequired, Email, Length
+from wtforms import (StringField, PasswordField, SubmitField, TextAreaField, DateTimeLocalField, SelectField,
+                     SelectMultipleField)
+from wtforms.validators import DataRequired, Email, Length, Optional
 from flask_ckeditor import CKEditorField
 
+from scaffold.utilities.recaptcha import PooledRecaptcha
+
 
 class LoginForm(FlaskForm):
     email = StringField('Email', validators=[DataRequired(), Email(), Length(min=6, max=64)])
     password = PasswordField('Password', validators=[DataRequired(), Length(min=6, max=128)])
     submit = SubmitField('Log In')
-    recaptcha = RecaptchaField()
+    recaptcha = RecaptchaField(validators=[PooledRecaptcha()])
 
 
 class ContactForm(FlaskForm):
     email = StringField('Email', validators=[DataRequired(), Email(), Length(min=6, max=64)])
     name = StringField('Name', validators=[DataRequired(), Length(min=1, max=128)])
     message = TextAreaField('Message', validators=[DataRequired(), Length(min=1, max=500)])
+    # Honeypot: hidden from people, so only bots fill it in. See ContactFilter.
+    website = StringField('Website')
     submit = SubmitField('Submit')
-    recaptcha = RecaptchaField()
+    recaptcha = RecaptchaField(validators=[PooledRecaptcha()])
 
 
 class BlogPostForm(FlaskForm):
     title = StringField('Title', validators=[DataRequired(), Length(min=1, max=128)])
     content = CKEditorField('Text', validators=[DataRequired()])
+    tags = StringField('Tags (comma separated)', validators=[Optional(), Length(max=512)])
+    publish_at = DateTimeLocalField('Publish at (optional)', format='%Y-%m-%dT%H:%M', validators=[Optional()])
     submit = SubmitField('Post')
+
+
+class BulkActionForm(FlaskForm):
+    action = SelectField('Action', choices=[('publish', 'Publish'), ('unpublish', 'Un-Publish'), ('delete', 'Delete')])
+    # Filled from the checkboxes on the admin page; ids that no longer exist are ignored.
+    post_ids = SelectMultipleField(coerce=int, validate_choice=False, validators=[DataRequired()])
+    submit = SubmitField('Apply to selected')
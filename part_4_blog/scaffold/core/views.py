@@ -1,29 +1,130 @@
 import logging
-import os
 import datetime
 
 import nh3
-from flask import render_template, Blueprint, url_for, redirect, current_app, send_from_directory, request, abort
+from flask import render_template, stream_template, Blueprint, url_for, redirect, current_app, request, abort
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.exceptions import HTTPException
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 from flask_ckeditor import upload_success, upload_fail
+from sqlalchemy.orm import joinedload
 
-from scaffold import db
-from scaffold.models import User, BlogPost
-from scaffold.core.forms import LoginForm, ContactForm, BlogPostForm
+from scaffold import (db, publish_scheduler, page_cache, storage, contact_filter, recaptcha_verifier, log_pipeline,
+                      runtime_stats)
+from scaffold.models import (User, BlogPost, PopularPost, PostViews, BlogPostRevision, BlogPostDraft, RelatedPost, Tag,
+                             PostTag)
+from scaffold.core.forms import LoginForm, ContactForm, BlogPostForm, BulkActionForm
 from scaffold.utilities.ses import Ses
+from scaffold.utilities.query_monitor import query_budget
+from scaffold.utilities.db_routing import read_only
+from scaffold.utilities.view_counter import ViewCounter
+from scaffold.utilities.revisions import record_revision, reconstruct
+from scaffold.utilities.scheduler import posts_published
+from scaffold.utilities.related_posts import RelatedPosts, related_posts_updated
+from scaffold.utilities.uploads import save_upload, UploadError
+from scaffold.utilities.drafts import DraftStore, DraftConflict
+from scaffold.utilities.tags import set_tags, untag_posts, refresh_tag_counts, tags_of
 
 
 core = Blueprint('core', __name__)
 logger = logging.getLogger('scaffold')
 
+view_counter = ViewCounter()
+related_posts = RelatedPosts()
+drafts = DraftStore()
+
+# Rows fetched from the database at a time by the streamed listing pages.
+STREAM_BATCH_SIZE = 100
+
+
+def stream_rows(statement):
+    """
+    Yield the results of a select in batches from a server-side cursor. Being
+    a generator, nothing runs until the template starts iterating, which for a
+    streamed response happens after the view has returned. The query monitor
+    still counts it, against the view's budget, once the response is closed.
+    """
+    yield from db.session.execute(statement.execution_options(yield_per=STREAM_BATCH_SIZE)).scalars()
+
+
+def keyset_page(statement, cursor):
+    """
+    One page of the published posts selected by `statement`, newest first,
+    and the cursor for the next page (None on the last one). A cursor is the
+    date and id of the last post shown; the next page seeks past it on the
+    (published, date, id) index instead of counting off an OFFSET, so every
+    page costs the same however far back it is.
+    """
+    size = current_app.config['ARCHIVE_PAGE_SIZE']
+    statement = (statement.options(joinedload(BlogPost.author))
+                 .filter(BlogPost.published.is_(True))
+                 .order_by(BlogPost.date.desc(), BlogPost.id.desc())
+                 .limit(size + 1))
+
+    if cursor:
+        try:
+            date, post_id = cursor.rsplit('_', 1)
+            date, post_id = datetime.datetime.fromisoformat(date), int(post_id)
+        except ValueError:
+            abort(400)
+        statement = statement.filter(db.tuple_(BlogPost.date, BlogPost.id) < (date, post_id))
+
+    posts = db.session.execute(statement).scalars().all()
+
+    if len(posts) <= size:
+        return posts, None
+    return posts[:size], f'{posts[size - 1].date.isoformat()}_{posts[size - 1].id}'
+
+
+def invalidate_pages(post_ids):
+    """
+    Drop cached pages showing any of these posts: their own pages and /blog.
+    """
+    page_cache.invalidate('blog', *[f'post:{post_id}' for post_id in post_ids])
+
+
+def delete_post_rows(post_ids):
+    """
+    Delete every row that refers to these posts, before the posts themselves.
+    SQLite doesn't enforce foreign keys, so ON DELETE CASCADE does nothing
+    there, and a new post given a deleted post's id would inherit its views,
+    related posts and drafts. Returns the ids of the other posts whose related
+    lists included one of these, to be recomputed. The caller commits.
+    """
+    untag_posts(post_ids)
+
+    for column in (BlogPostRevision.post_id, PostViews.post_id, PopularPost.post_id, BlogPostDraft.post_id):
+        db.session.execute(db.delete(column.class_).where(column.in_(post_ids)))
+
+    listing = db.session.execute(db.delete(RelatedPost)
+                                 .where(db.or_(RelatedPost.post_id.in_(post_ids),
+                                               RelatedPost.related_id.in_(post_ids)))
+                                 .returning(RelatedPost.post_id)).scalars()
+
+    return set(listing) - set(post_ids)
+
+
+@posts_published.connect
+def _scheduled_posts_published(sender, post_ids):
+    invalidate_pages(post_ids)
+    related_posts.schedule(post_ids)
+
+
+@related_posts_updated.connect
+def _related_posts_updated(sender, post_ids):
+    invalidate_pages(post_ids)
+
 
 # Routes (basic) ---------------------------------------------------------------
+# Query budgets count the user loader's lookup on any page that renders
+# base.html while logged in.
 @core.route('/')
+@query_budget(1)
+@read_only
 def index():
     return render_template('index.html')
 
 @core.route('/login', methods=['GET', 'POST'])
+@query_budget(2)
 def login():
     form = LoginForm()
 
@@ -46,6 +147,7 @@ def login():
     return render_template('login.html', form=form)
 
 @core.route('/welcome')
+@query_budget(1)
 @login_required
 def welcome():
     username = current_user.username
@@ -53,6 +155,7 @@ def welcome():
     return render_template('welcome.html', username=username)
 
 @core.route('/logout')
+@query_budget(1)
 @login_required
 def logout():
     logout_user()
@@ -60,9 +163,22 @@ def logout():
     return redirect(url_for('core.index'))
 
 @core.route('/contact', methods=['GET', 'POST'])
+@query_budget(1)
 def contact():
     form = ContactForm()
 
+    # Turn floods and bots away before ReCaptcha or SES cost anything.
+    if request.method == 'POST':
+        reason = contact_filter.check(request.remote_addr, request.form.get('email'),
+                                      request.form.get('message'), request.form.get('website'))
+        if reason is not None:
+            logger.warning(f'Contact form submission rejected: {reason}')
+
+            # Bots aren't told their message went nowhere.
+            if reason in ('honeypot', 'duplicate'):
+                return render_template('contact_thanks.html')
+            abort(429)
+
     if form.validate_on_submit():
         email = nh3.clean(form.email.data)
         subject = nh3.clean(form.name.data) + ' contact form submission'
@@ -88,7 +204,8 @@ def contact():
                                  body=body,
                                  body_html=body_html,
                                  client_address=ses.email)
-        
+        email_2 = False
+
         if email_1:  # Only send user email if we got their message.
             # Send an email to the user acknowledging receipt of their message.
             subject = 'Thanks for contacting us.'
@@ -112,11 +229,12 @@ def contact():
                 </html>
             '''
             email_2 = ses.send_email(subject=subject,
-                                    body=body,
-                                    body_html=body_html,
-                                    client_address=email)
+                                     body=body,
+                                     body_html=body_html,
+                                     client_address=email)
 
         if email_1 and email_2:  # If either email failed, user should know.
+            contact_filter.sent(form.email.data, form.message.data)
             return render_template('contact_thanks.html')
         else:
             return render_template('email_problem.html')
@@ -125,39 +243,138 @@ def contact():
 
 # Routes (blog posts) ----------------------------------------------------------
 @core.route('/blog')
+@query_budget(4)
+@read_only
 def blog():
     """
-    Display published blog posts to users.
+    Display published blog posts to users. The page is streamed while rows are
+    read from the cursor, so memory doesn't grow with the number of posts.
+    Anonymous readers all see the same page, so theirs is rendered once and
+    shared through the page cache instead, as long as it is small enough to
+    hold in memory.
+    """
+    if not current_user.is_authenticated:
+        return page_cache.stream('blog', render_blog)
+
+    return render_blog()
+
+def render_blog():
+    popular = db.session.execute(db.select(BlogPost)
+                                 .join(PopularPost, PopularPost.post_id == BlogPost.id)
+                                 .filter(BlogPost.published.is_(True))
+                                 .order_by(PopularPost.rank)).scalars().all()
+
+    tags = db.session.execute(db.select(Tag).filter(Tag.post_count > 0).order_by(Tag.name)).scalars().all()
+
+    posts = stream_rows(db.select(BlogPost)
+                        .options(joinedload(BlogPost.author))
+                        .filter_by(published=True)
+                        .order_by(BlogPost.date.desc()))
+
+    return stream_template('blog/blog.html', posts=posts, popular=popular, tags=tags)
+
+@core.route('/blog/tag/<slug>')
+@query_budget(3)
+@read_only
+def tag_posts(slug):
+    """
+    Published posts with a tag, a page at a time. See keyset_page().
     """
-    posts = db.session.execute(db.select(BlogPost).filter_by(published=True).order_by(BlogPost.date.desc())).scalars()
+    tag = db.session.execute(db.select(Tag).filter_by(slug=slug)).scalar()
+
+    if tag is None:
+        abort(404)
+
+    posts, cursor = keyset_page(db.select(BlogPost).join(PostTag, PostTag.post_id == BlogPost.id)
+                                .filter(PostTag.tag_id == tag.id), request.args.get('cursor'))
 
-    return render_template('blog/blog.html', posts=posts)
+    return render_template('blog/archive.html', heading=f'Posts tagged {tag.name}', tag=tag, posts=posts,
+                           cursor=cursor)
+
+@core.route('/blog/<int:year>/<int:month>')
+@query_budget(2)
+@read_only
+def month_posts(year, month):
+    """
+    Published posts from one month, a page at a time. See keyset_page().
+    """
+    if not (1 <= month <= 12 and 1 <= year < 9999):
+        abort(404)
+
+    start = datetime.datetime(year, month, 1)
+    end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+
+    posts, cursor = keyset_page(db.select(BlogPost).filter(BlogPost.date >= start, BlogPost.date < end),
+                                request.args.get('cursor'))
+
+    return render_template('blog/archive.html', heading=start.strftime('Posts from %B %Y'), tag=None,
+                           posts=posts, cursor=cursor)
 
 @core.route('/blog/admin')
+@query_budget(2)
 @login_required
 def blog_admin():
     """
-    Display all blog posts to admins.
+    Display all blog posts to admins, streamed like blog().
+    """
+    if not current_user.admin:
+        abort(403)
+
+    posts = stream_rows(db.select(BlogPost)
+                        .options(joinedload(BlogPost.author))
+                        .order_by(BlogPost.date.desc()))
+
+    return stream_template('blog/blog_admin.html', posts=posts, form=BulkActionForm())
+
+@core.route('/blog/admin/bulk', methods=['POST'])
+@query_budget(9)
+@login_required
+def bulk_action():
+    """
+    Publish, un-publish or delete every post selected on the admin page with
+    one set-based statement per table, all in a single transaction.
     """
     if not current_user.admin:
         abort(403)
 
-    posts = db.session.execute(db.select(BlogPost).order_by(BlogPost.date.desc())).scalars()
+    form = BulkActionForm()
 
-    return render_template('blog/blog_admin.html', posts=posts)
+    if form.validate_on_submit():
+        post_ids = form.post_ids.data
+
+        listing = set()
+        if form.action.data == 'delete':
+            listing = delete_post_rows(post_ids)
+            statement = db.delete(BlogPost).where(BlogPost.id.in_(post_ids))
+        else:
+            publish = form.action.data == 'publish'
+            # Posts already in the requested state keep their date.
+            statement = (db.update(BlogPost)
+                         .where(BlogPost.id.in_(post_ids), BlogPost.published.is_not(publish))
+                         .values(published=publish, date=datetime.datetime.now(), publish_at=None))
+
+        changed = db.session.execute(statement.returning(BlogPost.id)).scalars().all()
+        if form.action.data != 'delete' and changed:
+            refresh_tag_counts(tags_of(changed))
+        db.session.commit()
+
+        invalidate_pages(changed)
+        related_posts.schedule(listing.union(changed))
+
+    return redirect(url_for('core.blog_admin'))
 
 @core.route('/files/<path:filename>')
+@query_budget(0)
 def uploaded_files(filename):
     """
     Uploaded files for CKEditor.
     Reference:
     https://flask-ckeditor.readthedocs.io/en/latest/plugins.html#image-upload
     """
-    path = current_app.config['UPLOADED_PATH']
-
-    return send_from_directory(path, filename)
+    return storage.response(filename)
 
 @core.route('/upload', methods=['POST'])
+@query_budget(1)
 @login_required
 def upload():
     """
@@ -166,17 +383,20 @@ def upload():
     https://flask-ckeditor.readthedocs.io/en/latest/plugins.html#image-upload
     """
     f = request.files.get('upload')
-    extension = f.filename.split('.')[-1].lower()
+    if f is None:
+        return upload_fail(message='No file was uploaded.')
 
-    if extension not in ['jpg', 'png']:
-        return upload_fail(message='jpg or png image only.')
-    
-    f.save(os.path.join(current_app.config['UPLOADED_PATH'], f.filename))
-    url = url_for('core.uploaded_files', filename=f.filename)
+    try:
+        filename = save_upload(f, storage, current_app.config['UPLOAD_MAX_FILE_SIZE'])
+    except UploadError as e:
+        return upload_fail(message=str(e))
 
-    return upload_success(url, filename=f.filename)
+    url = url_for('core.uploaded_files', filename=filename)
+
+    return upload_success(url, filename=filename)
 
 @core.route('/create', methods=['GET', 'POST'])
+@query_budget(6)
 @login_required
 def create_post():
     """
@@ -188,35 +408,106 @@ def create_post():
     form = BlogPostForm()
 
     if form.validate_on_submit():
-        blog_post = BlogPost(user=current_user.username,
+        blog_post = BlogPost(author_id=current_user.id,
                      date=datetime.datetime.now(),
                      title=nh3.clean(form.title.data),
                      content=nh3.clean(form.content.data),
                      published=False)
+        blog_post.publish_at = form.publish_at.data
         
         db.session.add(blog_post)
+        set_tags(blog_post, form.tags.data)
+        record_revision(blog_post)
+        drafts.discard(current_user.id, 0)
         db.session.commit()
 
+        if form.publish_at.data:
+            publish_scheduler.wake()
+
         return redirect(url_for('core.blog'))
     
-    return render_template('blog/create_post.html', form=form)
+    return render_template('blog/create_post.html', form=form, draft_url=url_for('core.autosave', post_id=0))
+
+@core.route('/drafts/<int:post_id>', methods=['GET', 'POST'])
+@query_budget(2)
+@login_required
+def autosave(post_id):
+    """
+    Fetch (GET) or autosave (POST) the current admin's unsaved draft of a
+    post, where post_id 0 is a post not created yet. A save is JSON with the
+    version it builds on as "base", "title" only if it changed, and either
+    the full "content" or a "patch" ({"start", "end", "text"}) against the
+    base. Saves are held in memory and written to the database in batches.
+    """
+    if not current_user.admin:
+        abort(403)
+
+    if request.method == 'GET':
+        draft = drafts.get(current_user.id, post_id)
+        if draft is None:
+            return {'version': None}
+
+        return dict(draft, updated=draft['updated'].isoformat(timespec='seconds'))
+
+    data = request.get_json(silent=True)
+
+    try:
+        # Exactly one of content and patch; titles must fit BlogPostDraft.title.
+        if not isinstance(data, dict) or ('content' in data) == ('patch' in data) \
+                or not isinstance(data.get('content', ''), str) \
+                or not isinstance(data.get('title', ''), str) or len(data.get('title', '')) > 256:
+            raise ValueError
+
+        version = drafts.save(current_user.id, post_id, data.get('base'), title=data.get('title'),
+                              content=data.get('content'), patch=data.get('patch'))
+
+    except DraftConflict as e:
+        return {'error': str(e)}, 409
+
+    except (ValueError, TypeError, KeyError):
+        return {'error': 'Send a title, and the content or a patch.'}, 400
+
+    return {'version': version}
 
 @core.route('/<int:post_id>')
+@query_budget(3)
+@read_only
 def read_post(post_id):
     """
-    View individual blog posts based on the post id.
+    View individual blog posts based on the post id. Pages for anonymous
+    readers come from the page cache.
     """
-    blog_post = db.session.execute(db.select(BlogPost).filter_by(id=post_id)).scalar()
+    if not current_user.is_authenticated:
+        page = page_cache.fetch(f'post:{post_id}', lambda: render_post(post_id))
+    else:
+        page = render_post(post_id)
+
+    # Readers only get this far for published posts; admins aren't counted.
+    if not current_user.is_authenticated or not current_user.admin:
+        view_counter.increment(post_id)
+
+    return page
+
+def render_post(post_id):
+    blog_post = db.session.execute(db.select(BlogPost)
+                                   .options(joinedload(BlogPost.author), joinedload(BlogPost.tags))
+                                   .filter_by(id=post_id)).unique().scalar()
 
     # The post must be published in order to be publicly visible.
-    if blog_post.published or current_user.admin:
-        return render_template('blog/read_post.html', post=blog_post)
+    if blog_post is not None and (blog_post.published or (current_user.is_authenticated and current_user.admin)):
+        related = db.session.execute(db.select(BlogPost.id, BlogPost.title)
+                                     .join(RelatedPost, RelatedPost.related_id == BlogPost.id)
+                                     .filter(RelatedPost.post_id == post_id, BlogPost.published.is_(True))
+                                     .order_by(RelatedPost.rank)).all()
+
+        return render_template('blog/read_post.html', post=blog_post, related=related)
   
     else:                
         abort(404)
 
 
 @core.route('/<int:post_id>/update', methods=['GET', 'POST'])
+@query_budget(12)
 @login_required
 def update_post(post_id):
     """
@@ -230,20 +521,35 @@ def update_post(post_id):
     form = BlogPostForm()
 
     if form.validate_on_submit():
+        previous_title, previous_content = blog_post.title, blog_post.content
+
         blog_post.title = nh3.clean(form.title.data)
         blog_post.content=nh3.clean(form.content.data)
+        if not blog_post.published:
+            blog_post.publish_at = form.publish_at.data
+        set_tags(blog_post, form.tags.data)
+        record_revision(blog_post, previous_title, previous_content)
+        drafts.discard(current_user.id, post_id)
         db.session.commit()
+        invalidate_pages([post_id])
+        related_posts.schedule([post_id])
 
-        return redirect(url_for('core.read_post', post_id=blog_post.id))
+        if form.publish_at.data:
+            publish_scheduler.wake()
+
+        return redirect(url_for('core.read_post', post_id=post_id))
     
     # Pre-populate the form with current data
     elif request.method == 'GET':
         form.title.data = blog_post.title
         form.content.data = blog_post.content
+        form.publish_at.data = blog_post.publish_at
+        form.tags.data = ', '.join(tag.name for tag in blog_post.tags)
 
-    return render_template('blog/create_post.html', form=form)
+    return render_template('blog/create_post.html', form=form, draft_url=url_for('core.autosave', post_id=post_id))
     
 @core.route('/<int:post_id>/delete', methods=['GET', 'POST'])
+@query_budget(10)
 @login_required
 def delete_post(post_id):
     """
@@ -254,12 +560,16 @@ def delete_post(post_id):
     
     blog_post = db.session.execute(db.select(BlogPost).filter_by(id=post_id)).scalar()
 
+    listing = delete_post_rows([post_id])
     db.session.delete(blog_post)
     db.session.commit()
+    invalidate_pages([post_id])
+    related_posts.schedule(listing | {post_id})
 
     return redirect(url_for('core.blog'))
 
 @core.route('/<int:post_id>/publish', methods=['GET', 'POST'])
+@query_budget(4)
 @login_required
 def publish_post(post_id):
     """
@@ -272,11 +582,144 @@ def publish_post(post_id):
     
     blog_post.published = False if blog_post.published else True
     blog_post.date = datetime.datetime.utcnow()
+    blog_post.publish_at = None
+    refresh_tag_counts(tags_of([post_id]))
+
+    db.session.commit()
+    invalidate_pages([post_id])
+    related_posts.schedule([post_id])
+
+    return redirect(url_for('core.read_post', post_id=post_id))
+
+@core.route('/<int:post_id>/revisions')
+@query_budget(3)
+@login_required
+def post_revisions(post_id):
+    """
+    List a blog post's saved revisions, newest first, for admins.
+    """
+    if not current_user.admin:
+        abort(403)
+
+    blog_post = db.session.execute(db.select(BlogPost).filter_by(id=post_id)).scalar()
+
+    if blog_post is None:
+        abort(404)
+
+    revisions = db.session.execute(db.select(BlogPostRevision.number, BlogPostRevision.date,
+                                             BlogPostRevision.title, BlogPostRevision.length,
+                                             BlogPostRevision.snapshot)
+                                   .filter_by(post_id=post_id)
+                                   .order_by(BlogPostRevision.number.desc())).all()
+
+    return render_template('blog/revisions.html', post=blog_post, revisions=revisions)
+
+@core.route('/<int:post_id>/revisions/<int:number>/restore', methods=['POST'])
+@query_budget(8)
+@login_required
+def restore_revision(post_id, number):
+    """
+    Make an old revision the current content of a blog post. The restore is
+    itself recorded as a new revision, so it can be undone.
+    """
+    if not current_user.admin:
+        abort(403)
 
+    blog_post = db.session.execute(db.select(BlogPost).filter_by(id=post_id)).scalar()
+    content = reconstruct(post_id, number)
+
+    if blog_post is None or content is None:
+        abort(404)
+
+    title = db.session.execute(db.select(BlogPostRevision.title)
+                               .filter_by(post_id=post_id, number=number)).scalar()
+    previous_title, previous_content = blog_post.title, blog_post.content
+
+    blog_post.title = title
+    blog_post.content = content
+    record_revision(blog_post, previous_title, previous_content)
     db.session.commit()
+    invalidate_pages([post_id])
+    related_posts.schedule([post_id])
 
     return redirect(url_for('core.read_post', post_id=post_id))
 
+# Routes (operations) ----------------------------------------------------------
+@core.route('/healthz')
+@query_budget(0)
+def healthz():
+    """
+    Liveness probe: the worker is up and serving requests. Does no I/O, so
+    an outage elsewhere never gets healthy workers restarted.
+    """
+    return {'status': 'ok'}
+
+@core.route('/readyz')
+@query_budget(1)
+def readyz():
+    """
+    Readiness probe: can this worker serve every page right now? Checks the
+    primary database with a trivial query, the upload storage, and the mail
+    configuration used by Ses. Failures are logged rather than returned, as
+    the probe is public.
+    """
+    checks = {}
+
+    def database():
+        with db.engine.connect() as connection:
+            connection.execute(db.text('SELECT 1'))
+
+    for name, check in (('database', database), ('storage', storage.check), ('mail', Ses.check)):
+        try:
+            check()
+            checks[name] = 'ok'
+        except Exception as e:
+            logger.warning(f'Readiness check {name} failed due to {e}')
+            checks[name] = 'failed'
+
+    ready = all(result == 'ok' for result in checks.values())
+    return {'status': 'ready' if ready else 'unavailable', 'checks': checks}, 200 if ready else 503
+
+@core.route('/admin/stats')
+@query_budget(1)
+@login_required
+def admin_stats():
+    """
+    This worker's connection pool counters, cache hit ratios and queue
+    depths, as JSON. `?tracemalloc=start` starts tracing allocations, after
+    which the top `?limit=` allocating lines are included until
+    `?tracemalloc=stop`.
+    """
+    if not current_user.admin:
+        abort(403)
+
+    action = request.args.get('tracemalloc')
+    if action == 'start':
+        runtime_stats.start()
+    elif action == 'stop':
+        runtime_stats.stop()
+
+    def with_hit_ratio(stats, hits, misses):
+        hit_count = sum(stats.get(key, 0) for key in hits)
+        lookups = hit_count + sum(stats.get(key, 0) for key in misses)
+        return dict(stats, hit_ratio=round(hit_count / lookups, 4) if lookups else None)
+
+    return {
+        'pools': runtime_stats.pools(),
+        'caches': {
+            'pages': with_hit_ratio(page_cache.stats(), ('hits', 'stale_hits', 'coalesced'), ('misses',)),
+            'recaptcha': with_hit_ratio(recaptcha_verifier.stats(), ('cache_hits',), ('verified', 'failed')),
+        },
+        'queues': {
+            'log': log_pipeline.stats(),
+            'view_counter': view_counter.stats(),
+            'drafts': drafts.stats(),
+            'related_posts': related_posts.stats(),
+        },
+        'contact_filter': contact_filter.stats(),
+        'tracemalloc': runtime_stats.top(request.args.get('limit', 10, type=int)),
+    }
+
 # Exceptions -------------------------------------------------------------------
 @core.app_errorhandler(HTTPException)
 def error(e):
@@ -284,3 +727,15 @@ def error(e):
     Catchall for HTTPExceptions; shows the custom error page with the code.
     """
     return render_template('error.html', code=e.code)
+
+@core.app_errorhandler(RequestEntityTooLarge)
+def too_large(e):
+    """
+    Bodies over MAX_CONTENT_LENGTH are refused as soon as anything reads the
+    form, which for /upload is CSRFProtect before the view runs, so CKEditor's
+    JSON answer is given here instead.
+    """
+    if request.endpoint == 'core.upload':
+        return upload_fail(message='The upload is too large.')
+
+    return error(e)
@@ -27,16 +27,131 @@ class User(db.Model, UserMixin):
 
 
 class BlogPost(db.Model):
+    # Serves the archive and tag pages, which read published posts newest
+    # first, a page at a time.
+    __table_args__ = (db.Index('ix_blog_post_published_date_id', 'published', 'date', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
-    user = db.Column(db.String(64), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    # Legacy copy of the author's username; only read by `flask backfill-authors`.
+    user = db.Column(db.String(64), nullable=True)
     date = db.Column(db.DateTime, nullable=False)
     title = db.Column(db.String(256), nullable=False)
     content = db.Column(db.Text, nullable=False)
     published = db.Column(db.Boolean(), default=False)
+    # When set, the scheduler publishes the post at this (local) time.
+    publish_at = db.Column(db.DateTime, index=True)
+
+    author = db.relationship('User', backref='posts')
+    # PostTag rows are deleted explicitly, with untag_posts().
+    tags = db.relationship('Tag', secondary='post_tag', order_by='Tag.name', passive_deletes=True)
 
-    def __init__(self, user, date, title, content, published):
-        self.user = user
+    def __init__(self, author_id, date, title, content, published):
+        self.author_id = author_id
         self.date = date
         self.title = title
         self.content = content
         self.published = published
+
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    slug = db.Column(db.String(64), unique=True, nullable=False)
+    # Published posts with this tag, kept up to date by refresh_tag_counts()
+    # so that listing tags never counts rows.
+    post_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, name, slug):
+        self.name = name
+        self.slug = slug
+
+
+class PostTag(db.Model):
+    # The primary key finds a post's tags, and the (tag_id, post_id) index a
+    # tag's posts, both without reading the table.
+    __table_args__ = (db.Index('ix_post_tag_tag_id_post_id', 'tag_id', 'post_id'),)
+
+    post_id = db.Column(db.Integer, db.ForeignKey('blog_post.id', ondelete='CASCADE'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True)
+
+    def __init__(self, post_id, tag_id):
+        self.post_id = post_id
+        self.tag_id = tag_id
+
+
+class PostViews(db.Model):
+    post_id = db.Column(db.Integer, db.ForeignKey('blog_post.id', ondelete='CASCADE'), primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, post_id, views):
+        self.post_id = post_id
+        self.views = views
+
+
+class PopularPost(db.Model):
+    rank = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('blog_post.id', ondelete='CASCADE'), nullable=False)
+
+    def __init__(self, rank, post_id):
+        self.rank = rank
+        self.post_id = post_id
+
+
+class BlogPostRevision(db.Model):
+    __table_args__ = (db.UniqueConstraint('post_id', 'number'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('blog_post.id', ondelete='CASCADE'), nullable=False)
+    number = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    title = db.Column(db.String(256), nullable=False)
+    # Uncompressed length of the content, for display.
+    length = db.Column(db.Integer, nullable=False)
+    # Either the full content, or a delta against the previous revision, both
+    # zlib compressed.
+    snapshot = db.Column(db.Boolean(), nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    post = db.relationship('BlogPost')
+
+    def __init__(self, post, number, date, title, length, snapshot, data):
+        self.post = post
+        self.number = number
+        self.date = date
+        self.title = title
+        self.length = length
+        self.snapshot = snapshot
+        self.data = data
+
+
+class RelatedPost(db.Model):
+    # Primary key (post_id, rank), so a post's list is one index range scan.
+    post_id = db.Column(db.Integer, db.ForeignKey('blog_post.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    related_id = db.Column(db.Integer, db.ForeignKey('blog_post.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+    def __init__(self, post_id, rank, related_id, score):
+        self.post_id = post_id
+        self.rank = rank
+        self.related_id = related_id
+        self.score = score
+
+
+class BlogPostDraft(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    # The post being edited, or 0 for a post that hasn't been created yet.
+    post_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(256), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    updated = db.Column(db.DateTime, nullable=False)
+
+    def __init__(self, user_id, post_id, version, title, content, updated):
+        self.user_id = user_id
+        self.post_id = post_id
+        self.version = version
+        self.title = title
+        self.content = content
+        self.updated = updated
@@ -0,0 +1,107 @@
+// Autosaves the post form on create_post.html every few seconds, sending only
+// what changed since the last save the server acknowledged.
+(function () {
+    var form = document.querySelector('form[data-autosave-url]');
+    if (!form) {
+        return;
+    }
+
+    var INTERVAL = 5000;
+    var url = form.dataset.autosaveUrl;
+    var csrfInput = form.querySelector('input[name="csrf_token"]');
+    var csrfToken = csrfInput ? csrfInput.value : '';
+    var title = form.querySelector('[name="title"]');
+    var notice = document.getElementById('draft-notice');
+
+    // What the server holds: a null content means the next save sends it all.
+    var saved = {version: null, title: null, content: null};
+    var saving = false;
+
+    function editorContent() {
+        var editor = window.CKEDITOR && CKEDITOR.instances.content;
+        return editor ? editor.getData() : form.querySelector('[name="content"]').value;
+    }
+
+    // The one changed stretch between two strings, by code point so that the
+    // offsets match Python's.
+    function diff(before, after) {
+        var a = Array.from(before), b = Array.from(after);
+        var start = 0, endA = a.length, endB = b.length;
+
+        while (start < endA && start < endB && a[start] === b[start]) {
+            start++;
+        }
+        while (endA > start && endB > start && a[endA - 1] === b[endB - 1]) {
+            endA--;
+            endB--;
+        }
+
+        return {start: start, end: endA, text: b.slice(start, endB).join('')};
+    }
+
+    function save() {
+        var content = editorContent(), currentTitle = title.value;
+        if (saving || (content === saved.content && currentTitle === saved.title)) {
+            return;
+        }
+
+        var body = {base: saved.version};
+        if (currentTitle !== saved.title) {
+            body.title = currentTitle;
+        }
+        if (saved.content === null) {
+            body.content = content;
+        } else {
+            body.patch = diff(saved.content, content);
+        }
+
+        saving = true;
+        fetch(url, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': csrfToken},
+            body: JSON.stringify(body)
+        }).then(function (response) {
+            if (response.status === 409) {
+                saved = {version: saved.version, title: null, content: null};
+            } else if (response.ok) {
+                return response.json().then(function (data) {
+                    saved = {version: data.version, title: currentTitle, content: content};
+                });
+            }
+        }).catch(function () {
+            // Offline or the server is restarting; try again on the next tick.
+        }).finally(function () {
+            saving = false;
+        });
+    }
+
+    // Offer to restore a draft that differs from what the form was loaded with.
+    fetch(url, {credentials: 'same-origin'}).then(function (response) {
+        return response.json();
+    }).then(function (draft) {
+        if (draft.version === null) {
+            return;
+        }
+        saved = {version: draft.version, title: draft.title, content: draft.content};
+
+        if (draft.title !== title.value || draft.content !== editorContent()) {
+            notice.querySelector('span').textContent = 'You have an unsaved draft from ' + draft.updated + '.';
+            notice.querySelector('button').addEventListener('click', function () {
+                title.value = draft.title;
+                if (window.CKEDITOR && CKEDITOR.instances.content) {
+                    CKEDITOR.instances.content.setData(draft.content);
+                } else {
+                    form.querySelector('[name="content"]').value = draft.content;
+                }
+                notice.hidden = true;
+            });
+            notice.hidden = false;
+        }
+    });
+
+    var timer = setInterval(save, INTERVAL);
+    form.addEventListener('submit', function () {
+        clearInterval(timer);
+    });
+})();
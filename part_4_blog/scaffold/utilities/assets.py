@@ -0,0 +1,128 @@
+import os
+import re
+
+from flask import url_for
+from markupsafe import Markup
+
+
+# Selectors whose rules render what is above the fold on every page: the page
+# defaults, the navbar and the footer. A rule is kept when the first part of
+# any of its selectors is in this set.
+CRITICAL_SELECTORS = frozenset([
+    ':root', '[data-bs-theme=light]', '*', '::before', '::after', 'html', 'body', 'hr', 'h1', 'h2', 'h3', 'p',
+    'ul', 'a', 'a:hover', 'img', 'button', '.container-fluid', '.navbar', '.navbar-dark', '.navbar-brand',
+    '.navbar-nav', '.navbar-toggler', '.navbar-toggler:hover', '.navbar-toggler:focus', '.navbar-toggler-icon',
+    '.navbar-collapse', '.navbar-expand-sm', '.nav', '.nav-link', '.nav-link:hover', '.nav-link:focus',
+    '.collapse:not(.show)', '.bg-dark', '.text-muted', '.text-center', '.justify-content-center',
+    '.border-bottom', '.px-2', '.pb-3', '.mb-3',
+])
+
+COMMENT = re.compile(r'/\*.*?\*/', re.S)
+COMBINATOR = re.compile(r'\s*[\s>+~]\s*')
+
+
+def _rules(css):
+    """
+    Yield (prelude, body) for each top-level rule or at-rule block of `css`.
+    """
+    start = 0
+    while True:
+        opening = css.find('{', start)
+        if opening < 0:
+            return
+
+        depth, end = 1, opening + 1
+        while depth:
+            depth += {'{': 1, '}': -1}.get(css[end], 0)
+            end += 1
+
+        # Statements such as @charset end in ';' and have no block of their own.
+        yield css[start:opening].rsplit(';', 1)[-1].strip(), css[opening + 1:end - 1]
+        start = end
+
+
+def critical_css(css, selectors=CRITICAL_SELECTORS):
+    """
+    Return the rules of `css` that apply to `selectors`, including those
+    nested in @media blocks, minified as in the source.
+    """
+    kept = []
+
+    for prelude, body in _rules(COMMENT.sub('', css)):
+        if prelude.startswith('@media'):
+            inner = critical_css(body, selectors)
+            if inner:
+                kept.append(f'{prelude}{{{inner}}}')
+
+        elif not prelude.startswith('@'):
+            if any(COMBINATOR.split(selector.strip())[0] in selectors for selector in prelude.split(',')):
+                kept.append(f'{prelude}{{{body}}}')
+
+    return ''.join(kept)
+
+
+class Assets():
+    """
+    Serves the front end from our own static folder without blocking the
+    first paint on it:
+        - the stylesheets in ASSETS_INLINE_CSS (the critical subset of
+          Bootstrap) are read once and inlined in base.html as
+          `critical_css`, while the full Bootstrap stylesheet loads without
+          blocking rendering; those in ASSETS_SITE_CSS (our own base.css)
+          are inlined as `site_css` after it, so that they still override
+          Bootstrap once it has loaded,
+        - HTML responses carry a `Link: rel=preload` header for each file in
+          ASSETS_PRELOAD, so the browser starts fetching them before it has
+          parsed the page, and a proxy that supports it can send them ahead
+          as 103 Early Hints.
+
+    Run `flask critical-css` after changing the vendored Bootstrap or the
+    markup above the fold, to regenerate styles/critical.css.
+
+    Configuration:
+        - ASSETS_INLINE_CSS: static files inlined into every page, before
+          Bootstrap.
+        - ASSETS_SITE_CSS: static files inlined into every page, after
+          Bootstrap.
+        - ASSETS_PRELOAD: (static file, destination) pairs, e.g.
+          ('vendor/bootstrap/bootstrap.min.css', 'style').
+
+    Example Usage:
+        from scaffold.utilities.assets import Assets
+
+        assets = Assets(app)
+    """
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_INLINE_CSS', ['styles/critical.css'])
+        app.config.setdefault('ASSETS_SITE_CSS', ['styles/base.css'])
+        app.config.setdefault('ASSETS_PRELOAD', [])
+
+        self.inline_css = self._read(app, app.config['ASSETS_INLINE_CSS'])
+        self.site_css = self._read(app, app.config['ASSETS_SITE_CSS'])
+        self.app = app
+
+        app.context_processor(lambda: {'critical_css': self.inline_css, 'site_css': self.site_css})
+        app.after_request(self._preload_headers)
+        app.extensions['assets'] = self
+
+    @staticmethod
+    def _read(app, filenames):
+        inline = []
+        for filename in filenames:
+            with open(os.path.join(app.static_folder, filename), encoding='utf-8') as infile:
+                inline.append(infile.read())
+
+        # A '</' in the CSS would end the inline <style> element early.
+        return Markup('\n'.join(inline).replace('</', '<\\/'))
+
+    def _preload_headers(self, response):
+        if response.mimetype == 'text/html' and self.app.config['ASSETS_PRELOAD']:
+            response.headers.add('Link', ', '.join(
+                f'<{url_for("static", filename=filename)}>; rel=preload; as={destination}'
+                for filename, destination in self.app.config['ASSETS_PRELOAD']))
+
+        return response
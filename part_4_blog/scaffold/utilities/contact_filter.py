@@ -0,0 +1,156 @@
+import re
+import time
+import hashlib
+import threading
+from collections import deque, Counter
+
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def _digest(email, message):
+    """
+    Hash of a sender's message that doesn't change with case or whitespace.
+    """
+    message = WHITESPACE.sub(' ', (message or '').strip().lower())
+    return hashlib.sha256(f'{(email or "").strip().lower()}\0{message}'.encode('utf-8')).digest()
+
+
+class _SlidingWindow():
+    """
+    Per-key counts of recent events, allowing at most `limit` in any
+    `seconds`-long window.
+    """
+    def __init__(self):
+        self.events = {}
+
+    def allow(self, key, limit, seconds, now):
+        events = self.events.setdefault(key, deque())
+        while events and events[0] <= now - seconds:
+            events.popleft()
+
+        if len(events) >= limit:
+            return False
+
+        events.append(now)
+        return True
+
+    def prune(self, seconds, now):
+        for key in [key for key, events in self.events.items() if not events or events[-1] <= now - seconds]:
+            del self.events[key]
+
+
+class ContactFilter():
+    """
+    Cheap checks that run on a contact form submission before anything
+    external does (ReCaptcha verification, then two SES sends), so that a bot
+    flood is turned away in memory instead of costing API calls and worker
+    time. In order, a submission is rejected when:
+        - 'honeypot': the hidden `website` field, which people never see,
+          was filled in,
+        - 'ip_rate': its address sent more than CONTACT_IP_LIMIT submissions
+          in the last CONTACT_IP_SECONDS,
+        - 'email_rate': its email address did, against CONTACT_EMAIL_LIMIT and
+          CONTACT_EMAIL_SECONDS,
+        - 'duplicate': the same email address sent the same message
+          (ignoring case and whitespace) in the last
+          CONTACT_DUPLICATE_SECONDS. Two people sending a common message,
+          such as 'Hello', are not duplicates of each other.
+
+    Each worker process keeps its own windows. stats() returns how many
+    submissions were accepted and rejected for each reason.
+
+    Configuration:
+        - CONTACT_FILTER_ENABLED: set False to accept everything (e.g. for
+          load tests).
+        - CONTACT_IP_LIMIT / CONTACT_IP_SECONDS
+        - CONTACT_EMAIL_LIMIT / CONTACT_EMAIL_SECONDS
+        - CONTACT_DUPLICATE_SECONDS
+
+    Example Usage:
+        from scaffold.utilities.contact_filter import ContactFilter
+
+        contact_filter = ContactFilter(app)
+        reason = contact_filter.check(request.remote_addr, email, message, honeypot)
+        contact_filter.sent(email, message)  # once the emails have gone out
+    """
+    # Forget expired windows and message hashes after this many checks.
+    PRUNE_EVERY = 1000
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._addresses = _SlidingWindow()
+        self._emails = _SlidingWindow()
+        self._messages = {}
+        self._checks = 0
+        self._stats = Counter()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CONTACT_FILTER_ENABLED', True)
+        app.config.setdefault('CONTACT_IP_LIMIT', 5)
+        app.config.setdefault('CONTACT_IP_SECONDS', 600)
+        app.config.setdefault('CONTACT_EMAIL_LIMIT', 3)
+        app.config.setdefault('CONTACT_EMAIL_SECONDS', 3600)
+        app.config.setdefault('CONTACT_DUPLICATE_SECONDS', 86400)
+        self.app = app
+        app.extensions['contact_filter'] = self
+
+    def check(self, address, email, message, honeypot):
+        """
+        Return the reason to reject a submission, or None to let it through.
+        A submission counts towards each rate limit it gets as far as.
+        """
+        config = self.app.config
+        if not config['CONTACT_FILTER_ENABLED']:
+            return None
+
+        now = time.monotonic()
+        email = (email or '').strip().lower()
+
+        with self._lock:
+            self._checks += 1
+            if self._checks % self.PRUNE_EVERY == 0:
+                self._prune(now)
+
+            if honeypot:
+                reason = 'honeypot'
+            elif not self._addresses.allow(address, config['CONTACT_IP_LIMIT'], config['CONTACT_IP_SECONDS'], now):
+                reason = 'ip_rate'
+            elif not self._emails.allow(email, config['CONTACT_EMAIL_LIMIT'], config['CONTACT_EMAIL_SECONDS'], now):
+                reason = 'email_rate'
+            elif self._messages.get(_digest(email, message), 0) > now:
+                reason = 'duplicate'
+            else:
+                reason = None
+
+            self._stats[reason or 'accepted'] += 1
+
+        return reason
+
+    def sent(self, email, message):
+        """
+        Start the duplicate window for a message that was sent from `email`.
+        Messages that failed validation can be submitted again.
+        """
+        if not self.app.config['CONTACT_FILTER_ENABLED']:
+            return
+
+        expires = time.monotonic() + self.app.config['CONTACT_DUPLICATE_SECONDS']
+        digest = _digest(email, message)
+
+        with self._lock:
+            self._messages[digest] = expires
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _prune(self, now):
+        config = self.app.config
+        self._addresses.prune(config['CONTACT_IP_SECONDS'], now)
+        self._emails.prune(config['CONTACT_EMAIL_SECONDS'], now)
+        for digest in [digest for digest, expires in self._messages.items() if expires <= now]:
+            del self._messages[digest]
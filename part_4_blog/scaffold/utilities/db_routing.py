@@ -0,0 +1,97 @@
+import time
+import random
+
+from flask import g, session, request, current_app, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+
+def read_only(view):
+    """
+    Mark a view as safe to serve from a read replica. Place it directly below
+    the route decorator, like query_budget.
+
+    Example:
+        @core.route('/blog')
+        @read_only
+        def blog():
+            ...
+    """
+    view.read_only = True
+    return view
+
+
+class RoutingSession(Session):
+    """
+    Session that sends the SELECTs of read-only views to a replica engine and
+    everything else (writes, flushes, and every statement of other views) to
+    the primary. Replicas are the binds named 'replica_<n>' in
+    SQLALCHEMY_BINDS; with none configured it behaves like a plain session.
+
+    Example:
+        db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and isinstance(clause, Select) and _use_replica():
+            replicas = [engine for key, engine in self._db.engines.items()
+                        if key is not None and key.startswith('replica_')]
+            if replicas:
+                return random.choice(replicas)
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _use_replica():
+    return has_request_context() and g.get('use_replica', False)
+
+
+class ReplicaRouter():
+    """
+    Decides per request whether RoutingSession may use a replica: only for
+    views marked @read_only, and not for a user who wrote something in the
+    last REPLICA_STICKY_SECONDS, so that they always read their own writes
+    even while the replicas catch up.
+
+    Configuration:
+        - REPLICA_STICKY_SECONDS: how long a writer stays on the primary.
+
+    Example Usage:
+        from scaffold.utilities.db_routing import ReplicaRouter
+
+        replica_router = ReplicaRouter(app)
+    """
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 30)
+
+        app.before_request(self._route)
+        app.after_request(self._remember_write)
+        event.listen(RoutingSession, 'after_flush', self._flushed)
+        # Bulk UPDATE and DELETE statements (bulk actions, tag counts) write
+        # without a flush.
+        event.listen(RoutingSession, 'do_orm_execute', self._executed)
+
+    def _route(self):
+        view = current_app.view_functions.get(request.endpoint)
+        sticky = session.get('read_primary_until', 0) > time.time()
+
+        g.use_replica = getattr(view, 'read_only', False) and not sticky
+
+    def _flushed(self, db_session, flush_context):
+        if has_request_context():
+            g.wrote_to_primary = True
+
+    def _executed(self, orm_execute_state):
+        if has_request_context() and (orm_execute_state.is_insert or orm_execute_state.is_update
+                                      or orm_execute_state.is_delete):
+            g.wrote_to_primary = True
+
+    def _remember_write(self, response):
+        if g.get('wrote_to_primary'):
+            session['read_primary_until'] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+
+        return response
@@ -0,0 +1,211 @@
+import time
+import atexit
+import logging
+import datetime
+import threading
+
+from flask import current_app
+from sqlalchemy.dialects import sqlite, postgresql
+
+from scaffold import db
+from scaffold.models import BlogPostDraft
+
+
+logger = logging.getLogger('scaffold')
+
+
+class DraftConflict(Exception):
+    """
+    Raised when a patch is based on a different version of the draft than
+    the one this worker holds; the client should send the whole draft again.
+    """
+
+
+def apply_patch(text, patch):
+    """
+    Replace the characters of `text` between patch['start'] and patch['end']
+    with patch['text']. Offsets count code points, as Python strings do.
+    """
+    start, end = patch['start'], patch['end']
+
+    if not (isinstance(start, int) and isinstance(end, int) and 0 <= start <= end <= len(text)
+            and isinstance(patch['text'], str)):
+        raise DraftConflict('Patch does not fit the draft.')
+
+    return text[:start] + patch['text'] + text[end:]
+
+
+class DraftStore():
+    """
+    Keeps the latest autosaved draft of each admin's post in memory and writes
+    them to BlogPostDraft from a background thread, at most once every
+    DRAFT_FLUSH_SECONDS however often the editor saves. Each draft carries a
+    version number: saves send only what changed since a version, and a
+    write never replaces a newer version already in the table, so workers
+    that each saw some of the saves can't undo one another.
+
+    A post that hasn't been created yet has post_id 0.
+
+    Configuration:
+        - DRAFT_FLUSH_SECONDS: how often changed drafts are written.
+        - DRAFT_IDLE_SECONDS: how long a written draft stays in memory.
+
+    Example Usage:
+        from scaffold.utilities.drafts import DraftStore
+
+        drafts = DraftStore()
+        version = drafts.save(user_id, post_id, base=3, title=None, patch={'start': 10, 'end': 12, 'text': 'is'})
+        drafts.discard(user_id, post_id)  # once the post is saved
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._drafts = {}
+        self._dirty = set()
+        self._thread = None
+
+    def get(self, user_id, post_id):
+        """
+        The latest draft as a dict with version, title, content and updated,
+        or None. Must be called inside an app context.
+        """
+        key = (user_id, post_id)
+
+        with self._lock:
+            draft = self._drafts.get(key)
+        if draft is None:
+            draft = self._load(key)
+
+        if draft is None or draft['deleted']:
+            return None
+        return {name: draft[name] for name in ('version', 'title', 'content', 'updated')}
+
+    def save(self, user_id, post_id, base, title=None, content=None, patch=None):
+        """
+        Store a new version of a draft and return its number. Pass the full
+        `content`, or a `patch` against version `base`. `title` is only sent
+        when it changed. Raises DraftConflict when `base` isn't the version
+        held here. Must be called inside an app context.
+        """
+        key = (user_id, post_id)
+        self._start()
+
+        with self._lock:
+            current = self._drafts.get(key)
+        if current is None:
+            current = self._load(key)
+
+        with self._lock:
+            current = self._drafts.get(key, current)
+            known = current is not None and not current['deleted']
+
+            if content is None:
+                if not known or current['version'] != base:
+                    raise DraftConflict('The draft has changed; send it in full.')
+                content = apply_patch(current['content'], patch)
+
+            version = max(base or 0, current['version'] if current else 0) + 1
+            self._drafts[key] = {
+                'version': version,
+                'title': title if title is not None else (current['title'] if known else ''),
+                'content': content,
+                'updated': datetime.datetime.now(),
+                'deleted': False,
+                'touched': time.monotonic(),
+            }
+            self._dirty.add(key)
+
+        return version
+
+    def discard(self, user_id, post_id):
+        """
+        Forget a draft, e.g. once the post it belongs to has been saved.
+        """
+        key = (user_id, post_id)
+        self._start()
+
+        with self._lock:
+            draft = self._drafts.get(key)
+            self._drafts[key] = {
+                'version': draft['version'] + 1 if draft else 1,
+                'title': '', 'content': '', 'updated': None,
+                'deleted': True, 'touched': time.monotonic(),
+            }
+            self._dirty.add(key)
+
+    def flush(self):
+        """
+        Write every changed draft. Must be called inside an app context.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            drafts = {key: dict(self._drafts[key]) for key in dirty}
+
+            # Drafts nobody has saved for a while are left to the table.
+            idle = time.monotonic() - current_app.config['DRAFT_IDLE_SECONDS']
+            for key in [key for key, draft in self._drafts.items() if draft['touched'] < idle and key not in dirty]:
+                del self._drafts[key]
+
+        if not drafts:
+            return
+
+        dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+
+        try:
+            for (user_id, post_id), draft in drafts.items():
+                if draft['deleted']:
+                    db.session.execute(db.delete(BlogPostDraft).filter_by(user_id=user_id, post_id=post_id))
+                    continue
+
+                statement = dialect.insert(BlogPostDraft).values(
+                    user_id=user_id, post_id=post_id, version=draft['version'], title=draft['title'],
+                    content=draft['content'], updated=draft['updated'])
+                statement = statement.on_conflict_do_update(
+                    index_elements=[BlogPostDraft.user_id, BlogPostDraft.post_id],
+                    set_={name: statement.excluded[name] for name in ('version', 'title', 'content', 'updated')},
+                    where=BlogPostDraft.version < statement.excluded.version)
+                db.session.execute(statement)
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f'Draft flush failed due to {e}')
+
+            # Try again with the next flush, which writes whatever is newest by then.
+            with self._lock:
+                self._dirty.update(dirty)
+
+    def stats(self):
+        with self._lock:
+            return {'held': len(self._drafts), 'dirty': len(self._dirty)}
+
+    def _load(self, key):
+        row = db.session.execute(db.select(BlogPostDraft)
+                                 .filter_by(user_id=key[0], post_id=key[1])).scalar()
+        if row is None:
+            return None
+
+        draft = {'version': row.version, 'title': row.title, 'content': row.content, 'updated': row.updated,
+                 'deleted': False, 'touched': time.monotonic()}
+        with self._lock:
+            return self._drafts.setdefault(key, draft)
+
+    def _start(self):
+        with self._lock:
+            # Started lazily so that it lives in the worker, not a pre-fork master.
+            if self._thread is None:
+                app = current_app._get_current_object()
+                self._thread = threading.Thread(target=self._run, args=(app,), daemon=True, name='draft-store')
+                self._thread.start()
+                atexit.register(self._flush_in_context, app)
+
+    def _run(self, app):
+        while True:
+            time.sleep(app.config['DRAFT_FLUSH_SECONDS'])
+
+            with app.app_context():
+                self.flush()
+                db.session.remove()
+
+    def _flush_in_context(self, app):
+        with app.app_context():
+            self.flush()
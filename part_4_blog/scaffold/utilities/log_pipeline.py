@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import datetime
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, request, has_request_context
+from flask.logging import default_handler
+
+
+class _BoundedQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the caller: when the queue is full the
+    record is dropped and counted instead.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+
+class _RequestIdFilter(logging.Filter):
+    """
+    Stamps each record with the id of the request it was logged in. Runs in
+    the thread that logged the record, before it is queued.
+    """
+    def filter(self, record):
+        record.request_id = g.get('request_id') if has_request_context() else None
+        return True
+
+
+class _SamplingFilter(logging.Filter):
+    """
+    Keeps only a LOG_SAMPLE_RATE fraction of records logged with
+    `extra={'sampled': True}`. Other records always pass, so failures and
+    warnings must never be marked.
+    """
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+
+    def filter(self, record):
+        if getattr(record, 'sampled', False):
+            return random.random() < self.app.config['LOG_SAMPLE_RATE']
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, so that log shippers don't have to parse text.
+    """
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+class LogPipeline():
+    """
+    Takes log output off the request path. Records sent to the 'scaffold'
+    logger (which is also app.logger) only go onto a bounded in-memory queue;
+    a background listener thread formats them and writes them out. If the
+    sink falls behind and the queue fills up, new records are dropped and
+    counted rather than making requests wait.
+
+    Each request gets a correlation id, taken from an incoming X-Request-ID
+    header or generated, which is attached to every record logged during the
+    request and returned in the X-Request-ID response header.
+
+    High-volume success messages can be sampled by logging them with
+    `extra={'sampled': True}`; failures are always logged in full.
+
+    Configuration:
+        - LOG_LEVEL: level of the 'scaffold' logger, e.g. 'INFO'.
+        - LOG_FORMAT: 'text' for plain lines, or 'json' for one JSON object
+          per line.
+        - LOG_FILE: file to write to; standard error when unset.
+        - LOG_QUEUE_SIZE: records held before new ones are dropped.
+        - LOG_SAMPLE_RATE: fraction of sampled records kept, 0 to 1.
+
+    Example Usage:
+        from scaffold.utilities.log_pipeline import LogPipeline
+
+        log_pipeline = LogPipeline(app)
+        logger.warning('Email sent', extra={'sampled': True})
+    """
+    def __init__(self, app=None):
+        self.listener = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOG_LEVEL', 'WARNING')
+        app.config.setdefault('LOG_FORMAT', 'text')
+        app.config.setdefault('LOG_FILE', None)
+        app.config.setdefault('LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('LOG_SAMPLE_RATE', 0.1)
+        self.app = app
+
+        if app.config['LOG_FILE']:
+            self.sink = logging.FileHandler(app.config['LOG_FILE'])
+        else:
+            self.sink = logging.StreamHandler(sys.stderr)
+
+        if app.config['LOG_FORMAT'] == 'json':
+            self.sink.setFormatter(JsonFormatter())
+        else:
+            self.sink.setFormatter(logging.Formatter(
+                '[%(asctime)s] %(levelname)s %(request_id)s in %(module)s: %(message)s'))
+
+        self.handler = _BoundedQueueHandler(queue.Queue(maxsize=app.config['LOG_QUEUE_SIZE']))
+        self.handler.addFilter(_SamplingFilter(app))
+        self.handler.addFilter(_RequestIdFilter())
+
+        logger = logging.getLogger('scaffold')
+        logger.setLevel(app.config['LOG_LEVEL'])
+        logger.removeHandler(default_handler)
+        logger.addHandler(self.handler)
+        logger.propagate = False
+
+        app.before_request(self._assign_request_id)
+        app.after_request(self._return_request_id)
+        app.extensions['log_pipeline'] = self
+
+        self.start()
+        # Write out what is still queued when the process exits, and give
+        # forked workers their own listener, as threads don't survive fork().
+        atexit.register(self.stop)
+        os.register_at_fork(after_in_child=self._restart)
+
+    def start(self):
+        self.listener = QueueListener(self.handler.queue, self.sink, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def stats(self):
+        return {'queued': self.handler.queue.qsize(), 'dropped': self.handler.dropped}
+
+    def _restart(self):
+        self.handler.queue = queue.Queue(maxsize=self.app.config['LOG_QUEUE_SIZE'])
+        self.start()
+
+    def _assign_request_id(self):
+        incoming = request.headers.get('X-Request-ID', '')
+        g.request_id = incoming[:64] if incoming.isprintable() and incoming else uuid.uuid4().hex
+
+    def _return_request_id(self, response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
@@ -0,0 +1,70 @@
+import gc
+import os
+import logging
+
+import boto3
+from sqlalchemy.orm import configure_mappers
+
+from scaffold import db
+from scaffold.models import load_user
+
+
+logger = logging.getLogger('scaffold')
+
+def preload(app):
+    """
+    Do every piece of start-up work that can be shared in the master of a
+    pre-forking server, so that forked workers inherit it copy-on-write
+    instead of each building their own copy:
+        - configures the SQLAlchemy mappers, and compiles the user loader's
+          query into the engine's statement cache,
+        - compiles every template into app.jinja_env's cache,
+        - builds the URL map's matcher,
+        - loads the botocore service models for the SES and S3 clients (the
+          clients themselves, and their connections, are still made per
+          worker).
+
+    Then it closes the master's database connections, makes sure each worker
+    discards any it inherits, and calls gc.freeze() so that the collector in
+    the workers never touches (and so never copies) the preloaded objects.
+
+    Example Usage:
+        from scaffold import app
+        from scaffold.utilities.preload import preload
+
+        preload(app)
+    """
+    configure_mappers()
+
+    # Workers still start if the database can't be reached yet.
+    with app.app_context():
+        try:
+            load_user('0')
+        except Exception as e:
+            logger.warning(f'Preloading the user loader query failed due to {e}')
+        db.session.remove()
+
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    app.url_map.update()
+
+    for service in ('ses', 's3'):
+        boto3.client(service, region_name=app.config['S3_REGION'] or 'us-east-1')
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+        engines = list(db.engines.values())
+
+    # A connection must never be shared between processes; close=False leaves
+    # the socket to the process that opened it.
+    def reset_connections():
+        for engine in engines:
+            engine.dispose(close=False)
+
+    os.register_at_fork(after_in_child=reset_connections)
+
+    gc.collect()
+    gc.freeze()
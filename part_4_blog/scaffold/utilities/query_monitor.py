@@ -0,0 +1,145 @@
+import re
+import time
+import logging
+from collections import Counter
+
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger('scaffold')
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised when a view runs more SQL statements than its declared budget and
+    QUERY_MONITOR_ENFORCE_BUDGETS is set.
+    """
+
+
+def query_budget(max_queries):
+    """
+    Declare the maximum number of SQL statements a view may run per request.
+    Place it directly below the route decorator so that it marks the function
+    Flask actually registers.
+
+    Example:
+        @core.route('/blog')
+        @query_budget(2)
+        def blog():
+            ...
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+
+    return decorator
+
+
+class QueryMonitor():
+    """
+    Development and test helper which records every SQL statement executed
+    during a request, including those a streamed response runs while it is
+    being sent, then flags:
+        - N+1 patterns: the same statement shape repeated within one request.
+        - Slow statements: anything slower than QUERY_MONITOR_SLOW_MS.
+        - Budget overruns: more statements than the view's @query_budget.
+
+    Configuration:
+        - QUERY_MONITOR: turn the monitor on (off by default).
+        - QUERY_MONITOR_SLOW_MS: latency threshold in milliseconds.
+        - QUERY_MONITOR_REPEAT_THRESHOLD: repeats of one shape before warning.
+        - QUERY_MONITOR_ENFORCE_BUDGETS: raise QueryBudgetExceeded instead of
+          only logging, so a test client request fails loudly.
+
+    Example Usage:
+        from scaffold.utilities.query_monitor import QueryMonitor
+
+        query_monitor = QueryMonitor(app)
+    """
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_MONITOR', False)
+        app.config.setdefault('QUERY_MONITOR_SLOW_MS', 100.0)
+        app.config.setdefault('QUERY_MONITOR_REPEAT_THRESHOLD', 3)
+        app.config.setdefault('QUERY_MONITOR_ENFORCE_BUDGETS', False)
+
+        if not app.config['QUERY_MONITOR']:
+            return
+
+        # Listening on the Engine class covers every engine the app creates.
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+        app.after_request(self.report)
+
+    @staticmethod
+    def statements():
+        """
+        The (statement, duration_ms) pairs recorded so far for this request.
+        """
+        return g.get('query_monitor_statements', [])
+
+    def report(self, response):
+        """
+        Inspect the statements recorded during the request, log anything
+        suspicious, and enforce the view's query budget. A streamed response
+        (stream_template) runs its queries while it is sent, after this, so
+        it is checked once it has been closed instead, and has no
+        X-Query-Count header.
+        """
+        statements = g.setdefault('query_monitor_statements', [])
+        view = current_app.view_functions.get(request.endpoint)
+        check = (statements, request.endpoint, getattr(view, 'query_budget', None), current_app.config)
+
+        if response.is_streamed:
+            response.call_on_close(lambda: self._check(*check))
+        else:
+            response.headers['X-Query-Count'] = str(len(statements))
+            self._check(*check)
+
+        return response
+
+    @staticmethod
+    def _check(statements, endpoint, budget, config):
+        shapes = Counter(_shape(statement) for statement, _ in statements)
+        for shape, count in shapes.items():
+            if count >= config['QUERY_MONITOR_REPEAT_THRESHOLD']:
+                logger.warning(f'Possible N+1 on {endpoint}: {count}x {shape}')
+
+        for statement, duration in statements:
+            if duration > config['QUERY_MONITOR_SLOW_MS']:
+                logger.warning(f'Slow query on {endpoint} ({duration:.1f} ms): {_shape(statement)}')
+
+        if budget is not None and len(statements) > budget:
+            message = f'{endpoint} ran {len(statements)} queries; budget is {budget}'
+
+            if config['QUERY_MONITOR_ENFORCE_BUDGETS']:
+                raise QueryBudgetExceeded(message)
+
+            logger.warning(message)
+
+
+def _shape(statement):
+    """
+    Collapse whitespace so identical statements compare equal. Parameters are
+    already bound as placeholders, so the text itself is the statement shape.
+    """
+    return re.sub(r'\s+', ' ', statement).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_monitor_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['query_monitor_start'].pop()
+
+    if has_request_context():
+        duration = (time.perf_counter() - start) * 1000
+        g.setdefault('query_monitor_statements', []).append((statement, duration))
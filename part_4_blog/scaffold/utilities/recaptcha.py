@@ -0,0 +1,181 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+from urllib.parse import urlencode
+
+import urllib3
+from flask import g, request, current_app, has_request_context
+from flask_wtf.recaptcha.validators import Recaptcha, RECAPTCHA_ERROR_CODES, RECAPTCHA_VERIFY_SERVER_DEFAULT
+from wtforms import ValidationError
+
+
+logger = logging.getLogger('scaffold')
+
+
+class RecaptchaVerifier():
+    """
+    Verifies ReCaptcha tokens over a persistent, keep-alive connection pool
+    with strict timeouts, and remembers recently verified tokens so that a
+    double-submitted form isn't verified twice. A remembered token is only
+    accepted once more, from the same address and for the same form (view),
+    so solving one captcha doesn't open a window for replaying it.
+
+    Configuration:
+        - RECAPTCHA_CONNECT_TIMEOUT / RECAPTCHA_READ_TIMEOUT: seconds.
+        - RECAPTCHA_CACHE_SECONDS: how long a verified token can be
+          resubmitted.
+        - RECAPTCHA_CACHE_SIZE: maximum number of remembered tokens.
+        - RECAPTCHA_STUB: 'pass' or 'fail' to skip Google entirely, for tests
+          and load runs.
+
+    Each request that verifies a token gets a `Server-Timing: recaptcha`
+    header with the time spent, and stats() returns running totals.
+
+    Example Usage:
+        from scaffold.utilities.recaptcha import RecaptchaVerifier
+
+        recaptcha_verifier = RecaptchaVerifier(app)
+    """
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._stats = {'verified': 0, 'cache_hits': 0, 'failed': 0, 'errors': 0, 'total_ms': 0.0}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RECAPTCHA_CONNECT_TIMEOUT', 2.0)
+        app.config.setdefault('RECAPTCHA_READ_TIMEOUT', 3.0)
+        app.config.setdefault('RECAPTCHA_CACHE_SECONDS', 120)
+        app.config.setdefault('RECAPTCHA_CACHE_SIZE', 10000)
+        app.config.setdefault('RECAPTCHA_STUB', None)
+
+        self.pool = urllib3.PoolManager(
+            maxsize=10,
+            timeout=urllib3.Timeout(connect=app.config['RECAPTCHA_CONNECT_TIMEOUT'],
+                                    read=app.config['RECAPTCHA_READ_TIMEOUT']),
+            retries=urllib3.Retry(total=1, backoff_factor=0.1),
+        )
+
+        app.extensions['recaptcha_verifier'] = self
+        app.after_request(self._server_timing)
+
+    def verify(self, token, remote_addr):
+        """
+        Returns Google's verification response as a dict. Only the 'success'
+        and 'error-codes' keys are guaranteed.
+        """
+        config = current_app.config
+        endpoint = request.endpoint if has_request_context() else ''
+        key = hashlib.sha256('\0'.join([token, remote_addr or '', endpoint or '']).encode('utf-8')).hexdigest()
+        start = time.perf_counter()
+
+        if config['RECAPTCHA_STUB']:
+            result = {'success': config['RECAPTCHA_STUB'] == 'pass'}
+
+        elif self._cached(key):
+            self._record('cache_hits', start)
+            return {'success': True}
+
+        else:
+            result = self._request(token, remote_addr)
+
+        if result['success']:
+            self._remember(key, config['RECAPTCHA_CACHE_SECONDS'], config['RECAPTCHA_CACHE_SIZE'])
+            self._record('verified', start)
+        else:
+            self._record('failed', start)
+
+        return result
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, cached_tokens=len(self._cache))
+
+    def _request(self, token, remote_addr):
+        verify_server = current_app.config.get('RECAPTCHA_VERIFY_SERVER') or RECAPTCHA_VERIFY_SERVER_DEFAULT
+        body = urlencode({'secret': current_app.config['RECAPTCHA_PRIVATE_KEY'],
+                          'remoteip': remote_addr,
+                          'response': token})
+
+        try:
+            response = self.pool.request('POST', verify_server, body=body,
+                                         headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        except urllib3.exceptions.HTTPError as e:
+            logger.warning(f'ReCaptcha verification failed due to {e}')
+            with self._lock:
+                self._stats['errors'] += 1
+            return {'success': False}
+
+        if response.status != 200:
+            return {'success': False}
+
+        try:
+            result = json.loads(response.data)
+        except ValueError as e:
+            logger.warning(f'ReCaptcha verification failed due to {e}')
+            result = None
+
+        if not isinstance(result, dict) or 'success' not in result:
+            with self._lock:
+                self._stats['errors'] += 1
+            return {'success': False}
+
+        return result
+
+    def _cached(self, key):
+        # Single use: the entry goes whether it is still valid or not.
+        with self._lock:
+            expires = self._cache.pop(key, None)
+            return expires is not None and expires >= time.monotonic()
+
+    def _remember(self, key, seconds, size):
+        now = time.monotonic()
+
+        with self._lock:
+            if len(self._cache) >= size:
+                self._cache = {k: v for k, v in self._cache.items() if v > now}
+                # Still full of live tokens; drop the oldest half.
+                if len(self._cache) >= size:
+                    self._cache = dict(list(self._cache.items())[size // 2:])
+            self._cache[key] = now + seconds
+
+    def _record(self, outcome, start):
+        elapsed = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._stats[outcome] += 1
+            self._stats['total_ms'] += elapsed
+
+        if has_request_context():
+            g.recaptcha_ms = g.get('recaptcha_ms', 0.0) + elapsed
+
+    def _server_timing(self, response):
+        if 'recaptcha_ms' in g:
+            response.headers.add('Server-Timing', f'recaptcha;dur={g.recaptcha_ms:.1f}')
+
+        return response
+
+
+class PooledRecaptcha(Recaptcha):
+    """
+    Drop-in replacement for Flask-WTF's Recaptcha validator which verifies
+    through the app's RecaptchaVerifier instead of a fresh urlopen() call.
+
+    Example:
+        recaptcha = RecaptchaField(validators=[PooledRecaptcha()])
+    """
+    def _validate_recaptcha(self, response, remote_addr):
+        result = current_app.extensions['recaptcha_verifier'].verify(response, remote_addr)
+
+        if result['success']:
+            return True
+
+        for error in result.get('error-codes', []):
+            if error in RECAPTCHA_ERROR_CODES:
+                raise ValidationError(RECAPTCHA_ERROR_CODES[error])
+
+        return False
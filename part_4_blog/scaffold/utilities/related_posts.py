@@ -0,0 +1,245 @@
+import re
+import html
+import logging
+import threading
+from collections import Counter
+
+import nh3
+import numpy as np
+from scipy import sparse
+from blinker import Namespace
+from flask import current_app
+
+from scaffold import db
+from scaffold.models import BlogPost, BlogPostRevision, RelatedPost
+
+
+logger = logging.getLogger('scaffold')
+
+signals = Namespace()
+
+# Sent with the ids of the posts whose related list was just rewritten, so that
+# cached pages showing the old list can be dropped.
+related_posts_updated = signals.signal('related-posts-updated')
+
+# Posts whose content is read with one query, keeping the IN list short.
+READ_BATCH_SIZE = 500
+
+TOKEN = re.compile(r"[a-z0-9][a-z0-9']+")
+
+STOP_WORDS = frozenset('''
+    about after again also and any are because been before being but can could did does doing down
+    each few for from further had has have having her here hers him his how into its itself just more
+    most not now off once only other our ours out over own same she should some such than that the
+    their theirs them then there these they this those through too under until very was were what when
+    where which while who whom why will with would you your yours
+'''.split())
+
+
+def extract_terms(title, content):
+    """
+    The words of a post, lowercased, without markup or stop words. The title
+    is counted twice, as it says more about the post than any one paragraph.
+    """
+    text = html.unescape(nh3.clean(content, tags=set()))
+    words = TOKEN.findall(f'{title} {title} {text}'.lower())
+
+    return Counter(word for word in words if word not in STOP_WORDS)
+
+
+def tfidf_matrix(documents):
+    """
+    Build an L2-normalised TF-IDF matrix, one row per document (a Counter of
+    terms), with sublinear term frequencies and smoothed inverse document
+    frequencies.
+    """
+    vocabulary = {}
+    rows, columns, counts = [], [], []
+
+    for row, terms in enumerate(documents):
+        for term, count in terms.items():
+            rows.append(row)
+            columns.append(vocabulary.setdefault(term, len(vocabulary)))
+            counts.append(count)
+
+    columns = np.asarray(columns, dtype=np.int64)
+    matrix = sparse.csr_matrix((1 + np.log(np.asarray(counts, dtype=np.float64)), (rows, columns)),
+                               shape=(len(documents), len(vocabulary)))
+
+    document_frequency = np.bincount(columns, minlength=len(vocabulary))
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+    matrix = sparse.csr_matrix(matrix.multiply(idf))
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+
+    return sparse.diags(1 / norms) @ matrix
+
+
+def nearest_neighbours(matrix, rows, k, batch_size):
+    """
+    Yield (row, [(neighbour, score), ...]) with the k most cosine-similar other
+    rows of `matrix` for each of `rows`. Similarities are computed a batch of
+    rows at a time, so memory stays at batch_size x len(matrix) floats.
+    """
+    k = min(k, matrix.shape[0] - 1)
+    if k <= 0:
+        return
+
+    for start in range(0, len(rows), batch_size):
+        batch = np.asarray(rows[start:start + batch_size])
+        scores = (matrix[batch] @ matrix.T).toarray()
+        scores[np.arange(len(batch)), batch] = 0
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for i, row in enumerate(batch):
+            order = top[i][np.argsort(-scores[i, top[i]])]
+            yield row, [(column, scores[i, column]) for column in order if scores[i, column] > 0]
+
+
+class RelatedPosts():
+    """
+    Keeps the RelatedPost table: for each published post, the published posts
+    most similar to it by the TF-IDF cosine similarity of their text. Reading
+    a post's list is then a single indexed lookup.
+
+    rebuild() recomputes every list, and is what `flask related-posts` runs.
+    update() recomputes only the lists of the given posts and of the posts
+    currently listing them; schedule() does that from a background thread, so
+    editing or publishing a post doesn't wait on it. Either way the TF-IDF
+    matrix of every published post is rebuilt, as the term weights depend on
+    all of them, but only the changed lists are compared against the rest and
+    written.
+
+    The terms of each post are kept between updates, along with the number of
+    its latest revision, so a post's content is only read and tokenised again
+    after it has been edited; an update otherwise reads just the ids and
+    revision numbers of the published posts.
+
+    Configuration:
+        - RELATED_POSTS_COUNT: how many related posts each post lists.
+        - RELATED_POSTS_BATCH_SIZE: posts whose similarities are computed at
+          once.
+
+    Example Usage:
+        from scaffold.utilities.related_posts import RelatedPosts
+
+        related_posts = RelatedPosts()
+        related_posts.schedule([post_id])  # after editing or publishing
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._wake = threading.Event()
+        self._thread = None
+        # {post id: (latest revision number, Counter of terms)}
+        self._terms = {}
+
+    def schedule(self, post_ids):
+        with self._lock:
+            self._pending.update(post_ids)
+
+            # Started lazily so that it lives in the worker, not a pre-fork master.
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(current_app._get_current_object(),),
+                                                daemon=True, name='related-posts')
+                self._thread.start()
+
+        self._wake.set()
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._pending)}
+
+    def rebuild(self):
+        """
+        Recompute every post's list. Must be called inside an app context.
+        """
+        return self._compute(None)
+
+    def update(self, post_ids):
+        """
+        Recompute the lists of `post_ids` and of the posts whose lists contain
+        them. Must be called inside an app context.
+        """
+        listing = db.session.execute(db.select(RelatedPost.post_id).distinct()
+                                     .where(RelatedPost.related_id.in_(post_ids))).scalars()
+
+        return self._compute(set(post_ids) | set(listing))
+
+    def _compute(self, post_ids):
+        config = current_app.config
+        revisions = dict(db.session.execute(db.select(BlogPost.id, db.func.max(BlogPostRevision.number))
+                                            .outerjoin(BlogPostRevision)
+                                            .filter(BlogPost.published.is_(True))
+                                            .group_by(BlogPost.id)
+                                            .order_by(BlogPost.id)).all())
+
+        terms = self._terms_of(revisions)
+        # A post deleted in the meantime has no terms.
+        ids = [post_id for post_id in revisions if post_id in terms]
+
+        if post_ids is None:
+            rows = list(range(len(ids)))
+            db.session.execute(db.delete(RelatedPost))
+        else:
+            rows = [row for row, post_id in enumerate(ids) if post_id in post_ids]
+            db.session.execute(db.delete(RelatedPost).where(RelatedPost.post_id.in_(post_ids)))
+
+        related = []
+        if rows:
+            matrix = tfidf_matrix([terms[post_id] for post_id in ids])
+            for row, neighbours in nearest_neighbours(matrix, rows, config['RELATED_POSTS_COUNT'],
+                                                      config['RELATED_POSTS_BATCH_SIZE']):
+                related.extend({'post_id': ids[row], 'rank': rank, 'related_id': ids[neighbour],
+                                'score': float(score)}
+                               for rank, (neighbour, score) in enumerate(neighbours))
+
+        if related:
+            db.session.execute(db.insert(RelatedPost), related)
+        db.session.commit()
+
+        updated = ids if post_ids is None else sorted(post_ids)
+        related_posts_updated.send(current_app._get_current_object(), post_ids=updated)
+
+        return updated
+
+    def _terms_of(self, revisions):
+        """
+        The terms of each post in `revisions` ({post id: latest revision
+        number}), reading only the posts edited since they were last seen.
+        """
+        with self._lock:
+            cached = {post_id: self._terms[post_id] for post_id in revisions if post_id in self._terms}
+
+        stale = [post_id for post_id, number in revisions.items()
+                 if post_id not in cached or cached[post_id][0] != number]
+        for start in range(0, len(stale), READ_BATCH_SIZE):
+            for post in db.session.execute(db.select(BlogPost.id, BlogPost.title, BlogPost.content)
+                                           .where(BlogPost.id.in_(stale[start:start + READ_BATCH_SIZE]))):
+                cached[post.id] = (revisions[post.id], extract_terms(post.title, post.content))
+
+        # Posts that were deleted or un-published are forgotten.
+        with self._lock:
+            self._terms = cached
+
+        return {post_id: terms for post_id, (number, terms) in cached.items()}
+
+    def _run(self, app):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+
+            with self._lock:
+                pending, self._pending = self._pending, set()
+
+            if not pending:
+                continue
+
+            with app.app_context():
+                try:
+                    self.update(pending)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning(f'Related posts update failed due to {e}')
+                db.session.remove()
@@ -0,0 +1,104 @@
+import json
+import zlib
+import datetime
+from difflib import SequenceMatcher
+
+from flask import current_app
+
+from scaffold import db
+from scaffold.models import BlogPostRevision
+
+
+def encode_delta(old, new):
+    """
+    Describe `new` as a list of operations on the lines of `old`: a [start,
+    end] pair copies old lines, a string inserts new text. Compressed with zlib.
+    """
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    ops = []
+
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b).get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j1 < j2:
+            ops.append(''.join(b[j1:j2]))
+
+    return zlib.compress(json.dumps(ops).encode('utf-8'))
+
+
+def apply_delta(old, data):
+    """
+    Rebuild the new text from `old` and a delta made by encode_delta().
+    """
+    a = old.splitlines(keepends=True)
+    parts = []
+
+    for op in json.loads(zlib.decompress(data)):
+        parts.append(''.join(a[op[0]:op[1]]) if isinstance(op, list) else op)
+
+    return ''.join(parts)
+
+
+def record_revision(blog_post, previous_title=None, previous_content=None):
+    """
+    Add a revision holding the post's current title and content to the
+    session; the caller commits. Every REVISION_SNAPSHOT_EVERY revisions is
+    stored in full so that reconstruct() never applies a long chain of deltas.
+
+    `previous_title` and `previous_content` must be the post as it was before
+    the edit being recorded, i.e. its latest revision. Posts that predate
+    revision history get that recorded as their first snapshot.
+    """
+    latest = None
+    if blog_post.id is not None:
+        latest = db.session.execute(db.select(db.func.max(BlogPostRevision.number))
+                                    .filter_by(post_id=blog_post.id)).scalar()
+    now = datetime.datetime.now()
+
+    if latest is None and previous_content is not None:
+        db.session.add(BlogPostRevision(post=blog_post, number=0, date=now, title=previous_title,
+                                        length=len(previous_content), snapshot=True,
+                                        data=zlib.compress(previous_content.encode('utf-8'))))
+        latest = 0
+
+    number = 0 if latest is None else latest + 1
+    snapshot = number % current_app.config['REVISION_SNAPSHOT_EVERY'] == 0
+
+    if snapshot:
+        data = zlib.compress(blog_post.content.encode('utf-8'))
+    else:
+        data = encode_delta(previous_content, blog_post.content)
+
+    revision = BlogPostRevision(post=blog_post, number=number, date=now, title=blog_post.title,
+                                length=len(blog_post.content), snapshot=snapshot, data=data)
+    db.session.add(revision)
+
+    return revision
+
+
+def reconstruct(post_id, number):
+    """
+    Return the content of one revision, starting from the nearest snapshot at
+    or before it and applying the deltas that follow. None if it doesn't exist.
+    """
+    start = db.session.execute(db.select(db.func.max(BlogPostRevision.number))
+                               .filter_by(post_id=post_id, snapshot=True)
+                               .filter(BlogPostRevision.number <= number)).scalar()
+
+    if start is None:
+        return None
+
+    revisions = db.session.execute(db.select(BlogPostRevision.number, BlogPostRevision.data)
+                                   .filter_by(post_id=post_id)
+                                   .filter(BlogPostRevision.number.between(start, number))
+                                   .order_by(BlogPostRevision.number)).all()
+
+    if revisions[-1].number != number:
+        return None
+
+    content = zlib.decompress(revisions[0].data).decode('utf-8')
+    for revision in revisions[1:]:
+        content = apply_delta(content, revision.data)
+
+    return content
@@ -0,0 +1,101 @@
+import threading
+import tracemalloc
+from collections import Counter
+
+from sqlalchemy import event
+
+
+class RuntimeStats():
+    """
+    Counts what each engine's connection pool does in this worker process,
+    and takes tracemalloc snapshots on demand, for the admin stats endpoint.
+
+    Pool counters are per engine ('default' for the primary, otherwise the
+    bind name): how many connections were opened, checked out and checked
+    in, alongside the pool's own view of how many are checked out now.
+
+    tracemalloc is off by default as it slows every allocation down; start()
+    turns it on, top() reports the lines that allocated the most memory
+    still alive since then, and stop() turns it off again.
+
+    Example Usage:
+        from scaffold.utilities.runtime_stats import RuntimeStats
+
+        runtime_stats = RuntimeStats(app, db)
+        runtime_stats.pools()
+    """
+    def __init__(self, app=None, db=None):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._engines = {}
+
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        with app.app_context():
+            for bind, engine in db.engines.items():
+                self._listen(bind or 'default', engine)
+
+        app.extensions['runtime_stats'] = self
+
+    def pools(self):
+        with self._lock:
+            counters = {name: dict(counter) for name, counter in self._counters.items()}
+
+        for name, engine in self._engines.items():
+            pool = engine.pool
+            counters[name]['pool'] = type(pool).__name__
+            # Only the queue-based pools can say how full they are.
+            for attribute in ('size', 'checkedout', 'overflow'):
+                if hasattr(pool, attribute):
+                    counters[name][attribute] = getattr(pool, attribute)()
+
+        return counters
+
+    @staticmethod
+    def start(frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    @staticmethod
+    def stop():
+        tracemalloc.stop()
+
+    @staticmethod
+    def top(limit=10):
+        """
+        The `limit` source lines holding the most traced memory, or None
+        when tracemalloc isn't running.
+        """
+        if not tracemalloc.is_tracing():
+            return None
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+
+        return {
+            'traced_kb': round(current / 1024, 1),
+            'peak_kb': round(peak / 1024, 1),
+            'top': [{'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+                     'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:limit]],
+        }
+
+    def _listen(self, name, engine):
+        counter = self._counters[name] = Counter(connects=0, checkouts=0, checkins=0)
+        self._engines[name] = engine
+
+        def count(key):
+            def listener(*args):
+                with self._lock:
+                    counter[key] += 1
+            return listener
+
+        # Listeners on the engine carry over to the new pool when it is disposed.
+        event.listen(engine, 'connect', count('connects'))
+        event.listen(engine, 'checkout', count('checkouts'))
+        event.listen(engine, 'checkin', count('checkins'))
@@ -0,0 +1,134 @@
+import os
+import logging
+import datetime
+import threading
+
+from blinker import Namespace
+
+from scaffold import db
+from scaffold.models import BlogPost
+from scaffold.utilities.tags import refresh_tag_counts, tags_of
+
+
+logger = logging.getLogger('scaffold')
+
+signals = Namespace()
+
+# Sent with the ids of the posts this process just published, so that caches
+# holding the old state of those posts can drop it.
+posts_published = signals.signal('posts-published')
+
+
+class PublishScheduler():
+    """
+    Publishes posts whose `publish_at` time has come, without anyone having to
+    be logged in. Rather than polling the whole table, the scheduler asks the
+    `publish_at` index for the next due time and sleeps until then.
+
+    The thread starts with the first request a process serves, so CLI
+    commands (`flask db upgrade` included) and the master of a pre-forking
+    server never run one. Every worker process runs its own scheduler. They
+    can't publish a post
+    twice: each one claims due posts with a single UPDATE ... RETURNING, and
+    only the worker whose update flipped a row sees it returned.
+
+    Configuration:
+        - SCHEDULER_ENABLED: set False to never start the thread (e.g. in
+          tests).
+        - SCHEDULER_MAX_SLEEP: seconds; the longest the scheduler sleeps
+          before checking again, which bounds how long it takes to notice a
+          post scheduled by another worker.
+
+    Example Usage:
+        from scaffold.utilities.scheduler import PublishScheduler
+
+        publish_scheduler = PublishScheduler(app)
+        publish_scheduler.wake()  # after scheduling a post
+    """
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SCHEDULER_ENABLED', True)
+        app.config.setdefault('SCHEDULER_MAX_SLEEP', 300)
+        self.app = app
+
+        if app.config['SCHEDULER_ENABLED']:
+            app.before_request(self.start)
+            # Threads don't survive fork(); a forked worker starts its own.
+            os.register_at_fork(after_in_child=self._reset)
+
+    def start(self):
+        """
+        Start the thread unless this process already has one.
+        """
+        with self._lock:
+            # Started lazily so that it lives in the worker, not a pre-fork master.
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='publish-scheduler')
+                self._thread.start()
+
+    def wake(self):
+        """
+        Recompute the next due time now, e.g. because a post was scheduled.
+        """
+        self._wake.set()
+
+    def publish_due(self):
+        """
+        Publish every post that is due and return their ids. Must be called
+        inside an app context.
+        """
+        now = datetime.datetime.now()
+
+        post_ids = db.session.execute(db.update(BlogPost)
+                                      .where(BlogPost.publish_at <= now)
+                                      .values(published=True, date=BlogPost.publish_at, publish_at=None)
+                                      .returning(BlogPost.id)).scalars().all()
+        if post_ids:
+            refresh_tag_counts(tags_of(post_ids))
+        db.session.commit()
+
+        if post_ids:
+            logger.warning(f'Published scheduled posts {post_ids}')
+            posts_published.send(self.app, post_ids=post_ids)
+
+        return post_ids
+
+    def next_due(self):
+        """
+        The earliest scheduled publish time, or None. Must be called inside an
+        app context.
+        """
+        return db.session.execute(db.select(db.func.min(BlogPost.publish_at))).scalar()
+
+    def _run(self):
+        while True:
+            timeout = self.app.config['SCHEDULER_MAX_SLEEP']
+
+            try:
+                with self.app.app_context():
+                    self.publish_due()
+                    due = self.next_due()
+                    db.session.remove()
+
+            except Exception as e:
+                logger.warning(f'Scheduled publishing failed due to {e}')
+
+            else:
+                if due is not None:
+                    wait = (due - datetime.datetime.now()).total_seconds()
+                    timeout = max(0, min(timeout, wait))
+
+            self._wake.wait(timeout=timeout)
+            self._wake.clear()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
@@ -8,6 +8,8 @@ from botocore.exceptions import ClientError
 
 logger = logging.getLogger('scaffold')
 
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ses_config.yml')
+
 
 class Ses():
     """
@@ -38,8 +40,7 @@ class Ses():
         credentials from env vars. Then instantiates a boto3 client for SES.
         """
         try:
-            with open(os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                                   'ses_config.yml')) as infile:
+            with open(CONFIG_PATH) as infile:
                 config = yaml.safe_load(infile)
                 self.email = config['email']
                 self.region = config['region']
@@ -55,6 +56,20 @@ class Ses():
         except Exception as e:
             logger.warning(f'SES failed due to {e}')
 
+    @staticmethod
+    def check():
+        """
+        Raises if the configuration read by __init__ is missing or incomplete.
+        Makes no request to SES, so it is cheap enough for readiness probes.
+        """
+        with open(CONFIG_PATH) as infile:
+            config = yaml.safe_load(infile) or {}
+
+        missing = [key for key in ('email', 'region', 'charset') if not config.get(key)]
+        missing += [name for name in ('AWS_ACCESS_KEY', 'AWS_SECRET_KEY') if not os.environ.get(name)]
+        if missing:
+            raise KeyError(f'SES configuration is missing {", ".join(missing)}')
+
     def send_email(self, subject, body, body_html, client_address) -> bool:
         """
         Sends an email using the boto3 client and the provided details.
@@ -96,7 +111,8 @@ class Ses():
             logger.warning(e.response['Error']['Message'])
 
         else:
-            logger.warning(f'Email sent. Message ID: {response["MessageId"]}')
+            # One line per email adds up under load, so only a sample is kept.
+            logger.warning(f'Email sent. Message ID: {response["MessageId"]}', extra={'sampled': True})
             success = True
 
         return success
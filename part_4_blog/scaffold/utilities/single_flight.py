@@ -0,0 +1,309 @@
+import time
+import logging
+import threading
+
+from flask import request
+
+
+logger = logging.getLogger('scaffold')
+
+
+class _Flight():
+    """
+    One in-progress render that other requests for the same key wait on.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.page = None
+        self.error = None
+
+
+class _StreamedPage():
+    """
+    The chunks of a page being streamed to the first reader of its key, kept
+    (up to PAGE_CACHE_MAX_PAGE_SIZE characters) to be stored once they have
+    all been sent. The flight lands when the response is closed, which WSGI
+    servers always do, even when nothing was read, as for a HEAD request.
+    """
+    def __init__(self, cache, key, flight, chunks):
+        self._cache = cache
+        self._key = key
+        self._flight = flight
+        self._chunks = chunks
+        self._iterator = iter(chunks)
+        self._limit = cache.app.config['PAGE_CACHE_MAX_PAGE_SIZE']
+        self._kept = []
+        self._size = 0
+        self._finished = False
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._iterator)
+        except StopIteration:
+            self._finished = True
+            self.close()
+            raise
+        except Exception as e:
+            self._flight.error = e
+            self.close()
+            raise
+
+        self._size += len(chunk)
+        if self._kept is not None and self._size > self._limit:
+            self._kept = None
+        elif self._kept is not None:
+            self._kept.append(chunk)
+
+        return chunk
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+
+        try:
+            # A reader that went away leaves a partial page, which isn't kept.
+            if self._finished:
+                self._flight.page = ''.join(self._kept) if self._kept is not None else None
+                self._cache._store(self._key, self._flight.page, self._size)
+            if hasattr(self._chunks, 'close'):
+                self._chunks.close()
+        finally:
+            self._cache._land(self._key, self._flight)
+
+
+class PageCache():
+    """
+    In-process cache of rendered pages with single-flight misses and
+    stale-while-revalidate:
+        - Fresh entries are returned as they are.
+        - Stale entries are returned immediately too, while one background
+          thread renders a replacement, so readers never wait on regeneration.
+        - On a miss, the first request renders the page and every concurrent
+          request for the same key waits for, and shares, that one result.
+
+    Only cache pages that look the same to everyone, e.g. for anonymous users.
+    Errors (including aborts) are never cached, and a background refresh that
+    fails drops the entry.
+
+    Configuration:
+        - PAGE_CACHE_SECONDS: how long a page is fresh; 0 turns caching off.
+        - PAGE_CACHE_STALE_SECONDS: how long after that it may be served stale.
+        - PAGE_CACHE_SIZE: maximum number of pages kept.
+        - PAGE_CACHE_MAX_PAGE_SIZE: characters; pages bigger than this are
+          rendered for each reader instead of being cached.
+        - PAGE_CACHE_WAIT_SECONDS: how long a request waits on another's
+          render before rendering the page itself.
+
+    Each process has its own cache, so invalidate() only drops pages in the
+    process that calls it. Other workers keep serving their copy while it is
+    fresh, for at most PAGE_CACHE_SECONDS. After that, the requests that arrive
+    while a replacement renders still get the old copy.
+
+    Example Usage:
+        from scaffold.utilities.single_flight import PageCache
+
+        page_cache = PageCache(app)
+        page = page_cache.fetch(f'post:{post_id}', lambda: render_post(post_id))
+        page_cache.invalidate(f'post:{post_id}')
+    """
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._flights = {}
+        self._refreshing = set()
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0, 'refreshes': 0, 'errors': 0,
+                       'too_big': 0, 'timeouts': 0}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_SECONDS', 30)
+        app.config.setdefault('PAGE_CACHE_STALE_SECONDS', 300)
+        app.config.setdefault('PAGE_CACHE_SIZE', 1000)
+        app.config.setdefault('PAGE_CACHE_MAX_PAGE_SIZE', 256 * 1024)
+        app.config.setdefault('PAGE_CACHE_WAIT_SECONDS', 10)
+        self.app = app
+        app.extensions['page_cache'] = self
+
+    def fetch(self, key, render):
+        """
+        Return the cached page for `key`, calling `render()` (which must return
+        the page as a string) when there isn't one. Call inside a request; a
+        background refresh re-renders against the same path.
+        """
+        if self.app.config['PAGE_CACHE_SECONDS'] <= 0:
+            return render()
+
+        found, value = self._claim(key, render)
+
+        if found == 'page':
+            return value
+
+        if found == 'too_big':
+            return render()
+
+        if found == 'wait':
+            page = self._wait(value)
+            return render() if page is None else page
+
+        flight = value
+        try:
+            flight.page = render()
+            self._store(key, flight.page)
+            return flight.page
+
+        except BaseException as e:
+            flight.error = e
+            raise
+
+        finally:
+            self._land(key, flight)
+
+    def stream(self, key, render):
+        """
+        Like fetch(), for a page that `render()` returns in chunks, e.g. from
+        stream_template(); returns the page or an iterator of its chunks. The
+        first reader gets the page streamed as it renders, and it is only
+        cached if it came to at most PAGE_CACHE_MAX_PAGE_SIZE characters.
+        A bigger page is streamed to every reader instead, for the next
+        PAGE_CACHE_SECONDS, so it is never held in memory whole.
+        """
+        # Nothing reads the body of a HEAD response, so there is nothing to
+        # share, and the unread chunks are never rendered.
+        if self.app.config['PAGE_CACHE_SECONDS'] <= 0 or request.method == 'HEAD':
+            return render()
+
+        found, value = self._claim(key, lambda: ''.join(render()))
+
+        if found == 'page':
+            return value
+
+        if found == 'too_big':
+            return render()
+
+        if found == 'wait':
+            # The page was too big to share, or its first reader went away.
+            page = self._wait(value)
+            return render() if page is None else page
+
+        try:
+            chunks = render()
+        except BaseException as e:
+            value.error = e
+            self._land(key, value)
+            raise
+
+        return _StreamedPage(self, key, value, chunks)
+
+    def _claim(self, key, render):
+        """
+        Look `key` up, returning ('page', page) for a fresh or stale page,
+        ('too_big', None) for a page stream() won't cache, ('wait', flight)
+        when another request is rendering it, or ('lead', flight) when the
+        caller must render it and then call _land().
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and now < entry['fresh_until']:
+                if entry['page'] is None:
+                    return 'too_big', None
+                self._stats['hits'] += 1
+                return 'page', entry['page']
+
+            if entry is not None and now < entry['stale_until']:
+                self._stats['stale_hits'] += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    threading.Thread(target=self._refresh, args=(key, render, request.full_path),
+                                     daemon=True, name='page-cache-refresh').start()
+                return 'page', entry['page']
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._stats['coalesced'] += 1
+                return 'wait', flight
+
+            flight = self._flights[key] = _Flight()
+            self._stats['misses'] += 1
+            return 'lead', flight
+
+    def _land(self, key, flight):
+        with self._lock:
+            del self._flights[key]
+        flight.done.set()
+
+    def _wait(self, flight):
+        """
+        The page rendered by `flight`, or None when there is none to share or
+        it took longer than PAGE_CACHE_WAIT_SECONDS, for the caller to render
+        it itself.
+        """
+        if not flight.done.wait(self.app.config['PAGE_CACHE_WAIT_SECONDS']):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            return None
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.page
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+    def _store(self, key, page, size=None):
+        now = time.monotonic()
+        config = self.app.config
+
+        # Too big to keep: remember that for as long as the page would have
+        # stayed fresh, so fetch() and stream() render it directly meanwhile.
+        size = len(page) if page is not None else size
+        if size is not None and size > config['PAGE_CACHE_MAX_PAGE_SIZE']:
+            page = None
+
+        with self._lock:
+            if page is None:
+                self._stats['too_big'] += 1
+            self._entries.pop(key, None)
+            if len(self._entries) >= config['PAGE_CACHE_SIZE']:
+                # Dicts keep insertion order, so the first entry is the oldest.
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = {
+                'page': page,
+                'fresh_until': now + config['PAGE_CACHE_SECONDS'],
+                'stale_until': now + config['PAGE_CACHE_SECONDS'] + (config['PAGE_CACHE_STALE_SECONDS']
+                                                                     if page is not None else 0),
+            }
+
+    def _refresh(self, key, render, path):
+        try:
+            # A fresh, cookie-less request renders exactly what an anonymous
+            # reader of `path` would see.
+            with self.app.test_request_context(path):
+                self._store(key, render())
+                with self._lock:
+                    self._stats['refreshes'] += 1
+
+        except Exception as e:
+            self.invalidate(key)
+            with self._lock:
+                self._stats['errors'] += 1
+            logger.warning(f'Page cache refresh of {key} failed due to {e}')
+
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
@@ -0,0 +1,188 @@
+import os
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import boto3
+from flask import current_app, send_from_directory, redirect
+
+
+logger = logging.getLogger('scaffold')
+
+
+class LocalStorage():
+    """
+    Keeps uploads in the UPLOADED_PATH directory on this host.
+
+    Example Usage:
+        storage = LocalStorage()
+
+        with storage.writer('cat.png') as outfile:
+            outfile.write(data)
+
+        return storage.response('cat.png')
+    """
+    @property
+    def directory(self):
+        return current_app.config['UPLOADED_PATH']
+
+    @contextmanager
+    def writer(self, name):
+        """
+        Yield a file to write `name` into. It is written next to its
+        destination and renamed into place only if the block finishes without
+        an exception, so readers never see a partial file.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.upload-')
+
+        try:
+            with os.fdopen(fd, 'wb') as outfile:
+                yield outfile
+            os.replace(temp_path, os.path.join(self.directory, name))
+
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def response(self, name):
+        return send_from_directory(self.directory, name)
+
+    def check(self):
+        """
+        Raise if uploads can't currently be stored.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.access(self.directory, os.W_OK):
+            raise OSError(f'{self.directory} is not writable')
+
+
+class _S3Writer():
+    """
+    File-like object that sends what is written to S3 as a multipart upload,
+    holding at most one part in memory.
+    """
+    def __init__(self, client, bucket, key, part_size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, data):
+        self.buffer += data
+
+        while len(self.buffer) >= self.part_size:
+            self._send_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+
+    def complete(self):
+        # Small files never start a multipart upload.
+        if self.upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+            return
+
+        if self.buffer:
+            self._send_part(bytes(self.buffer))
+
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                              MultipartUpload={'Parts': self.parts})
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+    def _send_part(self, data):
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+
+        number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=number, Body=data)
+        self.parts.append({'PartNumber': number, 'ETag': response['ETag']})
+
+
+class S3Storage():
+    """
+    Keeps uploads in an S3 bucket (or anything S3-compatible, such as MinIO),
+    so that every worker on every host sees the same files. Reads redirect the
+    browser to a short-lived presigned URL rather than proxying the bytes.
+
+    Configuration:
+        - S3_BUCKET: bucket name.
+        - S3_PREFIX: prefix for object keys, e.g. 'uploads/'.
+        - S3_REGION: bucket region.
+        - S3_ENDPOINT_URL: set for MinIO or another S3-compatible service.
+        - S3_PART_SIZE: multipart part size in bytes (at least 5 MB).
+        - S3_URL_EXPIRES: seconds a presigned read URL stays valid.
+        - 'AWS_ACCESS_KEY' and 'AWS_SECRET_KEY' environment variables, as for
+          Ses.
+    """
+    def __init__(self, config):
+        self.bucket = config['S3_BUCKET']
+        self.prefix = config['S3_PREFIX']
+        self.region = config['S3_REGION']
+        self.endpoint_url = config['S3_ENDPOINT_URL']
+        self.part_size = config['S3_PART_SIZE']
+        self.url_expires = config['S3_URL_EXPIRES']
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Created on first use, so that each worker process builds its own.
+        with self._lock:
+            if self._client is None:
+                self._client = boto3.client(
+                    's3',
+                    region_name=self.region,
+                    endpoint_url=self.endpoint_url,
+                    aws_access_key_id=os.getenv('AWS_ACCESS_KEY'),
+                    aws_secret_access_key=os.getenv('AWS_SECRET_KEY'),
+                )
+            return self._client
+
+    @contextmanager
+    def writer(self, name):
+        """
+        Yield a file-like object to write `name` into. The object only
+        appears in the bucket if the block finishes without an exception.
+        """
+        writer = _S3Writer(self.client, self.bucket, self.prefix + name, self.part_size)
+
+        try:
+            yield writer
+            writer.complete()
+
+        except BaseException:
+            try:
+                writer.abort()
+            except Exception as e:
+                logger.warning(f'Aborting S3 upload of {name} failed due to {e}')
+            raise
+
+    def response(self, name):
+        url = self.client.generate_presigned_url('get_object',
+                                                 Params={'Bucket': self.bucket, 'Key': self.prefix + name},
+                                                 ExpiresIn=self.url_expires)
+
+        return redirect(url)
+
+    def check(self):
+        """
+        Raise if the bucket can't currently be reached.
+        """
+        self.client.head_bucket(Bucket=self.bucket)
+
+
+def create_storage(config):
+    """
+    Build the upload storage selected by the STORAGE_BACKEND setting.
+    """
+    if config['STORAGE_BACKEND'] == 's3':
+        return S3Storage(config)
+
+    return LocalStorage()
@@ -0,0 +1,103 @@
+import re
+
+from scaffold import db
+from scaffold.models import BlogPost, Tag, PostTag
+
+
+SEPARATORS = re.compile(r'[\W_]+')
+WHITESPACE = re.compile(r'\s+')
+
+# Longest tag name and slug; both columns are String(64).
+MAX_LENGTH = 64
+
+
+def slugify(name):
+    """
+    Lowercase `name` and join its words with hyphens, e.g. 'Flask & SQL' ->
+    'flask-sql'. Letters outside ASCII are kept.
+    """
+    return SEPARATORS.sub('-', name.lower()).strip('-')[:MAX_LENGTH]
+
+
+def parse_tags(text):
+    """
+    Split a comma separated list of tags into {slug: name}, in the order
+    given. Names that make the same slug are one tag; the first spelling wins.
+    """
+    tags = {}
+
+    for name in (text or '').split(','):
+        name = WHITESPACE.sub(' ', name).strip()[:MAX_LENGTH]
+        slug = slugify(name)
+        if slug:
+            tags.setdefault(slug, name)
+
+    return tags
+
+
+def tags_of(post_ids):
+    """
+    A select of the ids of every tag on these posts, for refresh_tag_counts().
+    """
+    return db.select(PostTag.tag_id).where(PostTag.post_id.in_(post_ids))
+
+
+def refresh_tag_counts(tag_ids):
+    """
+    Recount the published posts of each tag in `tag_ids` (ids, or a select
+    such as tags_of()) with one UPDATE. Call it, before committing, whenever
+    a post gains or loses tags or is published, un-published or deleted.
+    """
+    count = (db.select(db.func.count())
+             .select_from(PostTag)
+             .join(BlogPost, BlogPost.id == PostTag.post_id)
+             .where(PostTag.tag_id == Tag.id, BlogPost.published.is_(True))
+             .scalar_subquery())
+
+    db.session.execute(db.update(Tag).where(Tag.id.in_(tag_ids)).values(post_count=count))
+
+
+def set_tags(blog_post, text):
+    """
+    Replace the tags of `blog_post` with those listed in `text`, creating
+    tags that don't exist yet, and keep the counts of every tag it gained or
+    lost. The caller commits.
+    """
+    tags = parse_tags(text)
+
+    # A new post is written with everything else at commit, rather than on
+    # the first query here.
+    with db.session.no_autoflush:
+        previous = set(blog_post.tags)
+
+        found = {}
+        if tags:
+            found = {tag.slug: tag for tag in db.session.execute(db.select(Tag)
+                                                                 .where(Tag.slug.in_(tags))).scalars()}
+
+        # Tags seen for the first time are created with a single INSERT.
+        missing = [{'name': name, 'slug': slug} for slug, name in tags.items() if slug not in found]
+        if missing:
+            found.update((tag.slug, tag) for tag in db.session.execute(db.insert(Tag).returning(Tag),
+                                                                       missing).scalars())
+
+        blog_post.tags = [found[slug] for slug in tags]
+
+    # Only published posts are counted.
+    changed = previous.symmetric_difference(blog_post.tags)
+    if blog_post.published and changed:
+        db.session.flush()
+        refresh_tag_counts([tag.id for tag in changed])
+
+
+def untag_posts(post_ids):
+    """
+    Remove every tag from these posts, e.g. before deleting them, and recount
+    the tags they had. The caller commits.
+    """
+    tag_ids = db.session.execute(db.delete(PostTag)
+                                 .where(PostTag.post_id.in_(post_ids))
+                                 .returning(PostTag.tag_id)).scalars().all()
+
+    if tag_ids:
+        refresh_tag_counts(set(tag_ids))
@@ -0,0 +1,54 @@
+from werkzeug.utils import secure_filename
+
+
+# Leading bytes of each accepted image type, keyed by the extensions allowed
+# for it.
+MAGIC_BYTES = {
+    ('png',): b'\x89PNG\r\n\x1a\n',
+    ('jpg', 'jpeg'): b'\xff\xd8\xff',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """
+    Raised when an upload is rejected; the message is safe to show the user.
+    """
+
+
+def save_upload(file_storage, storage, max_size):
+    """
+    Stream an uploaded image into `storage` (see scaffold.utilities.storage)
+    in chunks and return the name it was saved under.
+
+    The storage only keeps the file once it is complete, under `max_size`
+    bytes, and its leading bytes match its extension, so readers never see a
+    partial or disguised file.
+    """
+    filename = secure_filename(file_storage.filename or '')
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    magic = next((magic for extensions, magic in MAGIC_BYTES.items() if extension in extensions), None)
+
+    if magic is None:
+        raise UploadError('jpg or png image only.')
+
+    with storage.writer(filename) as outfile:
+        size = 0
+        first = True
+
+        while chunk := file_storage.stream.read(CHUNK_SIZE):
+            if first and not chunk.startswith(magic):
+                raise UploadError('File contents do not match a jpg or png image.')
+            first = False
+
+            size += len(chunk)
+            if size > max_size:
+                raise UploadError(f'Images must be smaller than {max_size // 1024} KB.')
+
+            outfile.write(chunk)
+
+        if first:
+            raise UploadError('The file is empty.')
+
+    return filename
@@ -0,0 +1,142 @@
+import time
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy.dialects import sqlite, postgresql
+
+from scaffold import db
+from scaffold.models import BlogPost, PostViews, PopularPost
+
+
+logger = logging.getLogger('scaffold')
+
+
+class ViewCounter():
+    """
+    Buffers post view counts in memory and writes them to PostViews in
+    batched upserts from a background thread, so that readers never wait on a
+    write lock. The same thread periodically rebuilds the PopularPost table.
+
+    Configuration:
+        - VIEW_COUNTER_FLUSH_SECONDS: flush at least this often.
+        - VIEW_COUNTER_FLUSH_EVERY: flush early after this many views.
+        - POPULAR_POSTS_REFRESH_SECONDS: how often PopularPost is rebuilt.
+        - POPULAR_POSTS_COUNT: how many posts PopularPost holds.
+
+    Each worker process has its own buffer; counts that haven't been flushed
+    yet are written when the process exits.
+
+    Example Usage:
+        from scaffold.utilities.view_counter import ViewCounter
+
+        view_counter = ViewCounter()
+        view_counter.increment(post_id)
+    """
+    # Rows per upsert statement, well below SQLite's bound variable limit.
+    BATCH_SIZE = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_refresh = 0.0
+
+    def increment(self, post_id):
+        with self._lock:
+            self._pending[post_id] += 1
+            due = sum(self._pending.values()) >= current_app.config['VIEW_COUNTER_FLUSH_EVERY']
+
+            # Started lazily so that it lives in the worker, not a pre-fork master.
+            if self._thread is None:
+                app = current_app._get_current_object()
+                self._thread = threading.Thread(target=self._run, args=(app,), daemon=True,
+                                                name='view-counter')
+                self._thread.start()
+                atexit.register(self._flush_in_context, app)
+
+        if due:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Write all buffered counts in as few statements as possible.
+        Must be called inside an app context.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+
+        if not pending:
+            return
+
+        dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+        post_ids = list(pending)
+
+        try:
+            for start in range(0, len(post_ids), self.BATCH_SIZE):
+                # Views of posts deleted since are dropped, or the upsert would
+                # recreate their rows for a new post that reuses the id.
+                existing = db.session.execute(db.select(BlogPost.id)
+                                              .where(BlogPost.id.in_(post_ids[start:start + self.BATCH_SIZE])))
+                rows = [{'post_id': post_id, 'views': pending[post_id]} for post_id in existing.scalars()]
+                if not rows:
+                    continue
+
+                statement = dialect.insert(PostViews).values(rows)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[PostViews.post_id],
+                    set_={'views': PostViews.views + statement.excluded.views})
+                db.session.execute(statement)
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f'View counter flush failed due to {e}')
+
+            # Put the counts back so they go out with the next flush.
+            with self._lock:
+                self._pending.update(pending)
+
+    def stats(self):
+        with self._lock:
+            return {'pending_posts': len(self._pending), 'pending_views': sum(self._pending.values())}
+
+    def refresh_popular(self):
+        """
+        Rebuild PopularPost from the current view counts. Must be called
+        inside an app context.
+        """
+        post_ids = db.session.execute(db.select(PostViews.post_id)
+                                      .join(BlogPost, BlogPost.id == PostViews.post_id)
+                                      .filter(BlogPost.published.is_(True))
+                                      .order_by(PostViews.views.desc())
+                                      .limit(current_app.config['POPULAR_POSTS_COUNT'])).scalars().all()
+
+        db.session.execute(db.delete(PopularPost))
+        db.session.add_all(PopularPost(rank=rank, post_id=post_id) for rank, post_id in enumerate(post_ids))
+        db.session.commit()
+
+    def _run(self, app):
+        while True:
+            self._wake.wait(timeout=app.config['VIEW_COUNTER_FLUSH_SECONDS'])
+            self._wake.clear()
+
+            with app.app_context():
+                self.flush()
+
+                if time.monotonic() - self._last_refresh >= app.config['POPULAR_POSTS_REFRESH_SECONDS']:
+                    try:
+                        self.refresh_popular()
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.warning(f'Popular posts refresh failed due to {e}')
+                    self._last_refresh = time.monotonic()
+
+                db.session.remove()
+
+    def _flush_in_context(self, app):
+        with app.app_context():
+            self.flush()
@@ -0,0 +1,50 @@
+"""
+The CKEditor upload view, with CSRF protection on as it is in production.
+
+Run from the part_4_blog directory:
+    python -m pytest tests
+"""
+import io
+
+import pytest
+from flask_wtf.csrf import generate_csrf
+
+from benchmarks import seed
+from scaffold import app
+
+
+@pytest.fixture
+def client():
+    seed.seed(users=1, posts=0, files=0)
+    app.config['WTF_CSRF_ENABLED'] = True
+    app.config['MAX_CONTENT_LENGTH'] = 1024
+
+    client = app.test_client()
+    seed.login(client)
+
+    # The token of the client's session, as the editor page would embed it.
+    with client:
+        client.get('/create')
+        token = generate_csrf()
+
+    yield client, token
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+
+
+def upload(client, token, data):
+    return client.post('/upload', headers={'X-CSRFToken': token},
+                       data={'upload': (io.BytesIO(data), 'image.png')})
+
+
+def test_upload(client):
+    response = upload(*client, seed.PNG_BYTES)
+
+    assert 'url' in response.get_json()
+
+
+def test_upload_too_large(client):
+    response = upload(*client, seed.PNG_BYTES + bytes(2048))
+
+    assert response.get_json()['error']['message'] == 'The upload is too large.'